@@ -12,7 +12,8 @@ from AthenaCommon.AppMgr import topSequence
 from ROOT import gROOT
 
 from minty import AnalysisAlgorithm, athena_setup, setup_pool_skim
-from minty.utils import CutGroup, Cut, SetContainer, Histo, event_cache
+from minty.utils import (CutGroup, Cut, SetContainer, Histo, event_cache, 
+                         overlap_removal)
 
 MZ = 91.1876*GeV
 
@@ -89,12 +90,16 @@ gROOT.ProcessLine(".L VtxReweighting.C+")
 gROOT.ProcessLine(".L MuonPtCorr.C+")
 
 
+def hlv_eta_phi(x):
+    hlv = x.hlv()
+    return hlv.eta(), hlv.phi()
+
 def or_func(c1, c2, delta):
-    return lambda e : [x for x in getattr(e, c1) 
-                       if min([100] + [x.hlv().deltaR(y.hlv()) 
-                              for y in getattr(e, c2) 
-                              if not x == y]) 
-                       > delta]
+    def remove_overlaps(e):
+        kept, _ = overlap_removal(getattr(e, c1), getattr(e, c2), delta,
+                                  coordinates=hlv_eta_phi)
+        return kept
+    return remove_overlaps
 
 def cached_property(f):
     return property(event_cache(f))
@@ -1,3 +1,5 @@
+from time import time as _time
+IMPORT_STARTED = _time()
 
 from .main import main
 from .utils import init_root
@@ -9,3 +11,4 @@ try:
 except Exception as x:
     pass
 
+IMPORT_FINISHED = _time()
@@ -2,22 +2,61 @@ from __future__ import with_statement
 
 from logging import getLogger; log = getLogger("minty.base")
 
+from array import array
+from bisect import bisect_left
+from os import remove, rename
 from os.path import basename, exists
 from time import time
 
 import ROOT as R
 
-from EnergyRescalerTool import EnergyRescaler
-
-from minty.utils import timer, event_cache
+from minty.utils import (timer, event_cache, configure_cache, deferred_import,
+                         make_deferred_instance, memoization_stats)
+from minty.utils.io_stats import IOStats
+from minty.utils.prefetch import FilePrefetcher
+from minty.utils.progress import ProgressReporter
+from minty.utils.startup import startup_profile
+from minty.utils.preselect import formula_branches, preselect_entries
+from minty.utils.event_index import find_entries, make_entry_list
+from minty.utils.entry_cache import (entry_cache_key, entry_cache_filename,
+                                     load_entries, save_entries)
 from minty.utils.skimtree import skimtree
 from minty.utils.grl import GRL, FakeGRL
-from minty.histograms import HistogramManager
+from minty.histograms import HistogramManager, merge_outputs
+from minty.histograms.checkpoint import (write_checkpoint_entry, 
+                                         read_checkpoint_entry)
 from minty.metadata.period import period_from_run
+from minty.treedefs.base import Global
 from minty.treedefs.egamma import egamma_wrap_tree
+from minty.treedefs.capacity import needed_capacities
+from minty.treedefs.layout import resolve_branches
+from minty.treedefs.profile import profile_filename, load_profile, save_profile
+from minty.utils.parallel import (split_clusters, partial_filename, 
+                                  unused_filename, remove_stale_outputs,
+                                  fork_worker, wait_workers)
+
+EnergyRescaler = deferred_import("EnergyRescalerTool", "EnergyRescaler")
+
+def default_calibration(EnergyRescaler):
+    rescaler = EnergyRescaler()
+    rescaler.useDefaultCalibConstants()
+    return rescaler
 
 class DropEvent(Exception):
     pass
+
+class GrowCollections(Exception):
+    """
+    Raised by the event loop at the first entry of a file which needs bigger
+    collections than the wrapper has (see --adaptive-capacity)
+    """
+    def __init__(self, entry, capacities):
+        Exception.__init__(self, entry, capacities)
+        self.entry = entry
+        self.capacities = capacities
+
+# With --checkpoint-minutes, how often to look at the clock
+CLOCK_CHECK_EVENTS = 1000
     
 # Needed at least because we give some of the tree objects a reference to the 
 # tree through their class definitions. This is a bad idea but there is no other
@@ -26,27 +65,35 @@ AnalysisSingleton = None
 
 class AnalysisBase(object):
     def __init__(self, input_tree, options):
+        started = time()
         global AnalysisSingleton
         assert not AnalysisSingleton
         AnalysisSingleton = self
         
         self.release_16 = options.release == "rel16"
         self.project = options.project
-        self.specific_events = options.events
         
         self.last_tree = 0
         
         self.options = options
         self.original_tree = input_tree
         self.tree_name = input_tree.GetName()
-        self.input_tree = egamma_wrap_tree(input_tree, options)
+        with startup_profile.phase("egamma_wrap_tree"):
+            self.input_tree = egamma_wrap_tree(input_tree, options)
         # Save a few attribute lookups since this is on the critical path
         get_tree = self.input_tree.tree.GetTree
         type(self).root_tree = property(lambda s: get_tree())
         self.info = self.input_tree._selarg
+        self.specific_events = self.find_specific_events(options)
         
-        self.setup_grl(options)
-        self.setup_objects()
+        with startup_profile.phase("setup_grl"):
+            self.setup_grl(options)
+        with startup_profile.phase("setup_objects"):
+            self.setup_objects()
+        self.entry_range = self.find_entry_range(options)
+        self.setup_checkpoints(options)
+        self.setup_branch_profile(options)
+        self.setup_entry_cache(options)
         
         self.result_name = options.output
         self.histogram_manager = self.h = None
@@ -56,9 +103,65 @@ class AnalysisBase(object):
         self.should_dump = False
         self.events_to_dump = []
         self.tasks = []
+        # Tasks run by `chunk` in --columnar mode. See treedefs.columnar.
+        self.chunk_tasks = []
         self.stopwatch = R.TStopwatch()
+        self.io_stats = None
+        if options.io_stats:
+            self.io_stats = IOStats(input_tree)
+        self.prefetcher = None
+        if options.prefetch:
+            self.prefetcher = FilePrefetcher(options.prefetch_bytes)
+        if options.cache_stats:
+            event_cache.enable_stats()
+        # Number of calls to `event`, to count the events processed by a 
+        # loop which was interrupted by GrowCollections
+        self.events_looped = 0
         
         self.initialize_counters()
+        
+        startup_profile.record("analysis_init", started, time())
+        self.write_startup_profile()
+    
+    def write_startup_profile(self):
+        """
+        With --profile-startup, write where the time went before the loop (and
+        to the imports deferred until the first events, once they happened)
+        """
+        if self.options.profile_startup:
+            startup_profile.write(self.options.profile_startup)
+    
+    def find_specific_events(self, options):
+        """
+        The entries given by --events and --event-ids, sorted, without 
+        duplicates. None if neither was given.
+        """
+        if not (options.events or options.event_ids):
+            return None
+        events = set(options.events or ())
+        if options.event_ids:
+            branches = dict((path[0], branch) 
+                            for path, branch in resolve_branches(Global))
+            with timer("find %i events by id" % len(options.event_ids)):
+                events.update(find_entries(self.input_tree.tree, 
+                                           options.event_ids,
+                                           branches["RunNumber"], 
+                                           branches["EventNumber"]))
+        return sorted(events)
+    
+    def find_entry_range(self, options):
+        """
+        The entries to process: [skip, skip + limit), or with --shard i/N the
+        i-th of N cluster-aligned pieces of that.
+        """
+        chain = self.input_tree.tree
+        lo = options.skip
+        hi = min(chain.GetEntries(), lo + options.limit)
+        if options.shard:
+            index, count = options.shard
+            lo, hi = split_clusters(chain, lo, hi, count)[index]
+            log.info("Shard %i/%i is entries [%i, %i)", index, count, lo, hi)
+        return lo, hi
     
     def setup_grl(self, options):
         if options.grl_path:
@@ -75,25 +178,271 @@ class AnalysisBase(object):
         tree = self.input_tree
         from treedefs.base import EGamma, TruthPhoton
         TruthPhoton._event = EGamma._event = self.input_tree
-        EGamma._v16_energy_rescaler = EnergyRescaler()
-        EGamma._v16_energy_rescaler.useDefaultCalibConstants()
+        # Only loaded (and calibrated) when an energy is first rescaled
+        EGamma._v16_energy_rescaler = make_deferred_instance(
+            EnergyRescaler, default_calibration)
         
         global_instance = tree.Global_obj._instance
         global_instance._grl = self.grl
         global_instance._event = self.input_tree
     
+    def check_capacities(self, entry):
+        """
+        Called at `entry`, the first of a new file: raise GrowCollections if
+        the file needs bigger collections than the wrapper has.
+        """
+        collections = self.input_tree.collections
+        needed = needed_capacities(self.root_tree, collections)
+        if all(needed[name] <= capacity for name, _, capacity in collections):
+            return
+        capacities = dict((name, max(needed[name], capacity))
+                          for name, _, capacity in collections)
+        raise GrowCollections(entry, capacities)
+    
+    def grow_collections(self, capacities):
+        """
+        Wrap the input again with `capacities` ({name: capacity}), keeping 
+        the bound branches (and their branch profile state).
+        """
+        log.info("Growing collections: %s", ", ".join(
+            "%s=%i" % (name, capacity) 
+            for name, capacity in sorted(capacities.iteritems())))
+        binder = self.input_tree.branch_binder
+        self.input_tree = egamma_wrap_tree(self.original_tree, self.options,
+                                           capacities, binder)
+        self.info = self.input_tree._selarg
+        if binder:
+            binder.reapply_pruning()
+        self.setup_objects()
+    
+    def setup_branch_profile(self, options):
+        """
+        With --branch-profile, switch off the branches the profile for this
+        analysis doesn't list, or record the profile if there isn't one yet.
+        """
+        self.branch_profile = None
+        self.recording_profile = False
+        if not options.branch_profile:
+            return
+        
+        binder = self.input_tree.branch_binder
+        self.branch_profile = profile_filename(options.branch_profile, 
+                                               type(self), self.info.tuple_type)
+        if exists(self.branch_profile):
+            profile = load_profile(self.branch_profile)
+            if options.preselect:
+                # TTree::Draw doesn't turn branches back on by itself
+                profile |= formula_branches(self.input_tree.tree, 
+                                            options.preselect)
+            pruned = binder.prune(profile)
+            log.info("Using branch profile %s: disabled %i of %i branches",
+                     self.branch_profile, pruned, len(binder.buffers))
+        else:
+            log.info("No branch profile at %s, recording one", 
+                     self.branch_profile)
+            binder.start_recording()
+            self.recording_profile = True
+    
+    def save_branch_profile(self):
+        """
+        Write the branches read so far (or those which were missing from the
+        profile) to the branch profile.
+        """
+        binder = self.input_tree.branch_binder
+        if self.recording_profile:
+            self.recording_profile = binder.recording = False
+            branches = binder.accessed()
+            log.info("Writing branch profile with %i of %i branches to %s",
+                     len(branches), len(binder.buffers), self.branch_profile)
+            save_profile(self.branch_profile, branches)
+        
+        elif binder.unprofiled:
+            log.info("Adding %i branches to branch profile %s", 
+                     len(binder.unprofiled), self.branch_profile)
+            save_profile(self.branch_profile, binder.unprofiled)
+    
+    def setup_checkpoints(self, options):
+        """
+        With --checkpoint-every or --checkpoint-minutes, periodically write
+        the results so far to a checkpoint next to the output. With --resume,
+        carry on after the entry in that checkpoint.
+        """
+        self.checkpoint_file = options.output + ".checkpoint"
+        self.resumed_checkpoint = None
+        if options.resume:
+            self.resume_from_checkpoint(options)
+        
+        self.checkpointing = bool(options.checkpoint_every or 
+                                  options.checkpoint_minutes)
+        self.events_since_checkpoint = 0
+        self.last_checkpoint = time()
+        
+        self.progress = None
+        self.reset_heartbeat()
+    
+    def reset_heartbeat(self):
+        # Counts down to the next heartbeat, never reaches 0 if not needed
+        self.heartbeat_interval = self.heartbeat_countdown = self.next_heartbeat()
+    
+    def next_heartbeat(self, entry=None):
+        """
+        The number of events until the next heartbeat is needed, or -1. With
+        an `entry`, report progress first.
+        """
+        intervals = []
+        every = self.options.checkpoint_every
+        if every:
+            intervals.append(every - self.events_since_checkpoint)
+        if self.options.checkpoint_minutes:
+            intervals.append(CLOCK_CHECK_EVENTS)
+        if self.progress:
+            if entry is None:
+                intervals.append(self.progress.countdown())
+            else:
+                current_file = self.root_tree.GetDirectory().GetName()
+                intervals.append(self.progress.update(self.heartbeat_interval,
+                                 entry, current_file, self.exception_count))
+        return min(intervals) if intervals else -1
+    
+    def resume_from_checkpoint(self, options):
+        """
+        Carry on after the entry of the checkpoint
+        """
+        if not exists(self.checkpoint_file):
+            log.warning("No checkpoint at %s, starting from the beginning",
+                        self.checkpoint_file)
+            return
+        
+        entry = read_checkpoint_entry(self.checkpoint_file)
+        lo, hi = self.entry_range
+        self.entry_range = min(hi, entry + 1), hi
+        log.info("Resuming from %s after entry %i", self.checkpoint_file, entry)
+        
+        # The checkpoint counted the trees up to and including this one
+        chain = self.input_tree.tree
+        chain.LoadTree(entry)
+        self.last_tree = chain.GetTreeNumber() + 1
+        
+        # New checkpoints replace the old one, so keep it aside
+        self.resumed_checkpoint = self.checkpoint_file + ".resumed"
+        rename(self.checkpoint_file, self.resumed_checkpoint)
+        
+        if exists(options.output):
+            log.info("Removing %s left by the interrupted run", options.output)
+            remove(options.output)
+    
+    def heartbeat(self, entry):
+        """
+        Called every `heartbeat_interval` events, to write checkpoints and
+        progress reports when it's time.
+        """
+        if self.checkpointing:
+            self.events_since_checkpoint += self.heartbeat_interval
+            every = self.options.checkpoint_every
+            minutes = self.options.checkpoint_minutes
+            if ((every and self.events_since_checkpoint >= every) or
+                (minutes and time() - self.last_checkpoint >= 60 * minutes)):
+                self.checkpoint(entry)
+        
+        interval = self.next_heartbeat(entry)
+        self.heartbeat_interval = self.heartbeat_countdown = interval
+    
+    def start_progress(self, lo, hi):
+        """
+        With --status-file, report progress over entries [lo, hi)
+        """
+        if not self.options.status_file:
+            return
+        hi = min(hi, self.input_tree.tree.GetEntries())
+        self.progress = ProgressReporter(self.options.status_file, 
+                                         self.options.status_interval, lo, hi)
+        self.reset_heartbeat()
+    
+    def finish_progress(self, events):
+        if not self.progress:
+            return
+        tree = self.root_tree
+        current_file = tree.GetDirectory().GetName() if tree else None
+        self.progress.events = events
+        self.progress.write(self.progress.hi - 1, current_file, 
+                            self.exception_count, done=True)
+    
+    def checkpoint(self, entry):
+        """
+        Write everything up to and including `entry` to the checkpoint file
+        """
+        hm = self.histogram_manager
+        if hm is None:
+            return
+        
+        with timer("write checkpoint at entry %i" % entry):
+            self.write_counters(hm, checkpoint=True)
+            snapshot = self.checkpoint_file + ".tmp"
+            hm.snapshot(snapshot)
+            if self.resumed_checkpoint:
+                merged = self.checkpoint_file + ".merged"
+                merge_outputs(merged, [self.resumed_checkpoint, snapshot])
+                remove(snapshot)
+                snapshot = merged
+            write_checkpoint_entry(snapshot, entry)
+            rename(snapshot, self.checkpoint_file)
+        
+        self.events_since_checkpoint = 0
+        self.last_checkpoint = time()
+    
+    def finish_checkpoints(self):
+        """
+        Called once the output is complete: merge in the checkpoint this run
+        resumed from, and remove the checkpoints.
+        """
+        if self.resumed_checkpoint:
+            if self.histogram_manager:
+                output = self.histogram_manager.filename
+                inputs = [self.resumed_checkpoint, output]
+            else:
+                # Nothing was left to do after the checkpoint
+                output = self.options.output
+                inputs = [self.resumed_checkpoint]
+            merged = output + ".merged"
+            merge_outputs(merged, inputs)
+            rename(merged, output)
+            remove(self.resumed_checkpoint)
+        
+        if exists(self.checkpoint_file):
+            remove(self.checkpoint_file)
+    
+    def setup_entry_cache(self, options):
+        """
+        With --entry-cache, only visit the entries kept by an earlier run of
+        the same selection, or record them if there wasn't one.
+        """
+        self.entry_cache = self.cached_entries = self.kept_entries = None
+        if not options.entry_cache:
+            return
+        
+        lo, hi = self.entry_range
+        key = entry_cache_key(options.input_files, type(self), options, lo, hi)
+        self.entry_cache = entry_cache_filename(options.entry_cache, key)
+        if self.resumed_checkpoint:
+            # The kept entries from before the checkpoint aren't known
+            log.info("Resuming, not using the entry cache")
+        elif exists(self.entry_cache):
+            self.cached_entries = load_entries(self.entry_cache)
+            log.info("Using %i entries of [%i, %i) from entry cache %s", 
+                     len(self.cached_entries), lo, hi, self.entry_cache)
+        else:
+            log.info("Recording kept entries to %s", self.entry_cache)
+            self.kept_entries = array("l")
+    
+    def save_entry_cache(self, filename=None):
+        if self.kept_entries is not None:
+            save_entries(filename or self.entry_cache, self.kept_entries)
+    
     def get_unused_filename(self, name):
         """
         Return a file that doesn't exist yet by appending numbers to the filename
         """
-        if not exists(name):
-            return name
-        for i in xrange(300):
-            namepart = "%s.%i" % (name, i)
-            if not exists(namepart):
-                return namepart
-        
-        raise RuntimeError("Created more files than expected..")
+        return unused_filename(name)
     
     def init_result_store(self, period, run):
         """
@@ -117,43 +466,96 @@ class AnalysisBase(object):
         result_name = self.get_unused_filename(result_name)
         self.histogram_manager = self.h = HistogramManager(result_name)
     
+    def init_empty_result_store(self):
+        """
+        Create the result store when no event was processed (e.g. none passed
+        --preselect, or the entry cache was empty), so that the output and its
+        counters are still written. With --run-specific-output there is no
+        run to name it after, so nothing is written.
+        """
+        if self.options.run_specific_output:
+            log.info("No events were processed, not writing an output")
+            return
+        log.info("No events were processed, writing an empty output")
+        result_name = self.get_unused_filename(self.options.output)
+        self.histogram_manager = self.h = HistogramManager(result_name)
+    
     def initialize_counters(self):
         self.exception_count = 0
         self.dumped_events = 0
         self.files_processed = []
         self.file_metadata = []
+        self.preselect_entries = self.preselect_passed = 0
         self.stopwatch.Start()
+        if self.io_stats:
+            self.io_stats.reset()
+        if self.prefetcher:
+            self.prefetcher.reset()
             
     def flush(self):
         """
         Write analysis result to disk
         """
-        log.info("Flushing data store..")
         hm = self.histogram_manager
-        
+        if hm is None:
+            self.initialize_counters()
+            return
+        log.info("Flushing data store..")
+        self.write_counters(hm)
+        hm.finalize()
+        self.initialize_counters()
+    
+    def write_counters(self, hm, checkpoint=False):
+        """
+        Write the counters to `hm`. For a checkpoint they aren't reset, and
+        carry on counting afterwards.
+        """
         hm.write_parameter("exception_count", self.exception_count)
                 
         this_tree = self.input_tree.tree.GetTreeNumber()
         processed_trees = this_tree - self.last_tree + 1
-        self.last_tree = this_tree
+        if not checkpoint:
+            self.last_tree = this_tree
         hm.write_parameter("processed_trees", processed_trees)
         hm.write_parameter("jobs_files", 1)
         
         hm.write_parameter("walltime", self.stopwatch.RealTime())
         hm.write_parameter("cputime", self.stopwatch.CpuTime())
+        if checkpoint:
+            # Reading the times stopped the stopwatch
+            self.stopwatch.Start(False)
+        if self.io_stats:
+            io_stats = self.io_stats.collect(reset=not checkpoint)
+            for name, value in sorted(io_stats.iteritems()):
+                hm.write_parameter(name, value)
+        memoization = memoization_stats(reset=not checkpoint)
+        for name, (hits, misses, _) in sorted(memoization.iteritems()):
+            if hits or misses:
+                hm.write_parameter("memoize_hits_%s" % name, hits)
+                hm.write_parameter("memoize_misses_%s" % name, misses)
+        if self.options.cache_stats:
+            hm.write_object("event_cache_stats", 
+                            event_cache.collect_stats(reset=not checkpoint))
+        if self.options.preselect:
+            hm.write_parameter("preselect_entries", self.preselect_entries)
+            hm.write_parameter("preselect_passed", self.preselect_passed)
+        if self.prefetcher:
+            hm.write_parameter("prefetch_hits", self.prefetcher.hits)
+            hm.write_parameter("prefetch_misses", self.prefetcher.misses)
+            hm.write_parameter("prefetch_saved_time", self.prefetcher.saved_time)
         
         hm.write_object("file_processed_list", self.files_processed)
         if self.options.have_metadata:
             hm.write_object("file_metadata", self.file_metadata)
         
-        leaves = set(leaf
-                     for tree in self.input_tree._enabled_branches.values() 
-                     for leaf, descriptor in tree)
-        
-        hm.write_object("enabled_branches", leaves)
+        objects, size = map(sum, zip(*self.input_tree.footprint.values()))
+        hm.write_parameter("wrapper_objects", objects)
+        hm.write_parameter("wrapper_bytes", size)
         
-        hm.finalize()
-        self.initialize_counters()
+        hm.write_object("enabled_branches", self.enabled_leaves())
+        if self.branch_profile and self.input_tree.branch_binder.unprofiled:
+            hm.write_object("unprofiled_branches", 
+                            self.input_tree.branch_binder.unprofiled)
     
     def dump_events(self):
         if self.events_to_dump:
@@ -161,16 +563,40 @@ class AnalysisBase(object):
         start_skim = time()
         skimtree(self.options.dump, self.events_to_dump, self.original_tree)
         skim_time = time() - start_skim
-        self.histogram_manager.write_parameter("skimtime", skim_time)
+        if self.histogram_manager:
+            self.histogram_manager.write_parameter("skimtime", skim_time)
         log.info("Took {0:.3f}s to skim {1} events.".format(
                  skim_time, len(self.events_to_dump)))
     
     def finalize(self):
+        if self.histogram_manager is None:
+            self.init_empty_result_store()
         if self.options.dump:
             self.dump_events()
+        if self.branch_profile:
+            self.save_branch_profile()
         self.flush()
         
+    def enabled_leaves(self):
+        return set(leaf
+                   for tree in self.input_tree._enabled_branches.values() 
+                   for leaf, descriptor in tree)
+    
+    def prefetch_next_file(self):
+        """
+        Start prefetching the file after the one the chain is on
+        """
+        chain = self.input_tree.tree
+        files, current = chain.GetListOfFiles(), chain.GetTreeNumber()
+        self.prefetcher.arrived(files[current].GetTitle())
+        if current + 1 < files.GetEntries():
+            self.prefetcher.prefetch(files[current + 1].GetTitle())
+    
     def new_tree(self):
+        configure_cache(self.input_tree.tree, self.enabled_leaves(), 
+                        self.options.cache_learn_entries)
+        if self.prefetcher:
+            self.prefetch_next_file()
         self.files_processed.append(self.root_tree.GetDirectory().GetName())
         if self.options.have_metadata:
             lumi = self.root_tree.GetDirectory().Get("Lumi/%s" % self.tree_name)
@@ -180,21 +606,28 @@ class AnalysisBase(object):
         self.should_dump = False
         event.index = idx
         event_cache.invalidate()
+        
+        # Before anything is recorded for the entry, since it is processed
+        # again after the collections are grown
+        tree = self.root_tree
+        if self.current_tree != tree and self.options.adaptive_capacity:
+            self.check_capacities(idx)
+        
         self.current_run = event.RunNumber
         if self.current_run != self.previous_run:
             self.period, (_, _) = period_from_run(self.current_run)
             self.init_result_store(self.period, self.current_run)
             
-        tree = self.root_tree
         if self.current_tree != tree:
             self.new_tree()
             self.current_tree = tree
         
+        dropped = False
         try:
             for task in self.tasks:
                 task(self, event)
         except DropEvent:
-            pass
+            dropped = True
         except (KeyboardInterrupt, SystemExit):
             rlum = event.RunNumber, event.LumiBlock, event.index
             log.exception("Leaving code at (run, lb, idx) = %r", rlum)
@@ -214,28 +647,275 @@ class AnalysisBase(object):
         
         if self.should_dump:
             self.events_to_dump.append(idx)
+        if self.kept_entries is not None and not dropped:
+            self.kept_entries.append(idx)
+        self.previous_run = self.current_run
+        self.events_looped += 1
+        
+        self.heartbeat_countdown -= 1
+        if not self.heartbeat_countdown:
+            self.heartbeat(idx)
+        
+    def chunk(self, lo, chunk):
+        """
+        The --columnar counterpart of `event`: run the chunk_tasks over a 
+        treedefs.columnar.Chunk of entries. A chunk never spans two files, 
+        the result store is chosen by the first run in the chunk.
+        """
+        event_cache.invalidate()
+        self.current_run = chunk.RunNumber[0]
+        if self.current_run != self.previous_run:
+            self.period, (_, _) = period_from_run(self.current_run)
+            self.init_result_store(self.period, self.current_run)
+        
+        tree = self.root_tree
+        if self.current_tree != tree:
+            self.new_tree()
+            self.current_tree = tree
+        
+        try:
+            for task in self.chunk_tasks:
+                task(self, chunk)
+        except (KeyboardInterrupt, SystemExit):
+            log.exception("Leaving code at entries [%i, %i)", lo, lo + len(chunk))
+            raise
+        except:
+            f = basename(self.current_tree.GetDirectory().GetName())
+            rlum = f, lo, lo + len(chunk)
+            log.exception("Exception encountered in (file, lo, hi) = %r", rlum)
+            if self.options.shell_on_exception:
+                raise
+            
+            self.exception_count += 1
+            if self.exception_count > self.options.max_exception_count:
+                self.finalize()
+                raise RuntimeError("Encountered more than `max_exception_count`"
+                                   " exceptions. Aborting.")
+        
         self.previous_run = self.current_run
         
+        # Once per chunk, when the chunk took the countdown to (or past) 0
+        if self.heartbeat_interval > 0:
+            self.heartbeat_countdown -= len(chunk)
+            if self.heartbeat_countdown <= 0:
+                # The events processed since the last heartbeat
+                self.heartbeat_interval -= self.heartbeat_countdown
+                self.heartbeat(lo + len(chunk) - 1)
+    
+    def loop_range(self, lo, hi):
+        """
+        Process entries [lo, hi). Returns the number of entries processed.
+        """
+        warmup = self.options.profile_warmup
+        if self.recording_profile and warmup and hi - lo > warmup:
+            # Record the branch profile over the first `warmup` entries only
+            processed = self.loop_entries(lo, lo + warmup)
+            self.save_branch_profile()
+            return processed + self.loop_entries(lo + warmup, hi)
+        
+        return self.loop_entries(lo, hi)
+    
+    def loop_entries(self, lo, hi):
+        return self.loop_growing(self.loop_wrapped, lo, hi)
+    
+    def loop_growing(self, loop, lo, hi):
+        """
+        Returns loop(lo, hi), the number of entries processed. When that 
+        raises GrowCollections, the collections are grown and it is called
+        again from the entry where it happened.
+        """
+        processed = 0
+        while True:
+            looped = self.events_looped
+            try:
+                return processed + loop(lo, hi)
+            except GrowCollections, e:
+                processed += self.events_looped - looped
+                self.grow_collections(e.capacities)
+                lo = e.entry
+    
+    def loop_wrapped(self, lo, hi):
+        if self.cached_entries is not None:
+            entries = self.cached_entries
+            return self.loop_entry_list(
+                entries[bisect_left(entries, lo):bisect_left(entries, hi)])
+        
+        if self.options.preselect:
+            return self.loop_preselected(lo, hi)
+        
+        if self.options.columnar:
+            from minty.treedefs.columnar import loop_chunks
+            if self.tasks and not self.chunk_tasks:
+                log.warning("--columnar only runs chunk_tasks, but this "
+                            "analysis only has per-event tasks")
+            return loop_chunks(self.input_tree.tree, self.options, self.chunk,
+                               self.options.columnar, lo, hi)
+        
+        binder = self.input_tree.branch_binder
+        if binder and binder.lazy:
+            return binder.loop(self.input_tree, self.event, lo, hi)
+        
+        return self.input_tree.loop(self.event, lo=lo, hi=hi)
+    
+    def loop_preselected(self, lo, hi):
+        """
+        Process the entries in [lo, hi) which pass --preselect. The others
+        are rejected in C++ and never read into python.
+        """
+        entries = preselect_entries(self.input_tree.tree, 
+                                    self.options.preselect, lo, hi)
+        hi = min(hi, self.input_tree.tree.GetEntries())
+        self.preselect_entries += hi - lo
+        self.preselect_passed += len(entries)
+        try:
+            return self.loop_entry_list(entries)
+        except GrowCollections, e:
+            # The rest is preselected (and counted) again
+            self.preselect_entries -= hi - e.entry
+            self.preselect_passed -= len(entries) - bisect_left(entries, e.entry)
+            raise
+    
+    def loop_entry_list(self, entries):
+        """
+        Process each of `entries`.
+        """
+        for i in entries:
+            self.read_entry(i)
+            self.event(i, self.input_tree)
+        return len(entries)
+    
+    def loop_specific_events(self, entries):
+        """
+        Process `entries` (sorted) with a TEntryList set on the chain, so 
+        that the reads (and the TTreeCache) only visit the clusters needed.
+        """
+        chain = self.input_tree.tree
+        chain.SetEntryList(make_entry_list(chain, entries))
+        def loop(lo, hi):
+            return self.loop_entry_list(entries[bisect_left(entries, lo):])
+        try:
+            return self.loop_growing(loop, 0, None)
+        finally:
+            chain.SetEntryList(0)
+    
+    def read_entry(self, i):
+        """
+        Read entry `i` of the input, lazily if --lazy-read was given.
+        """
+        binder = self.input_tree.branch_binder
+        if binder and binder.lazy:
+            binder.load_entry(i)
+        else:
+            self.input_tree.GetEntry(i)
+    
+    def release_input_file(self):
+        """
+        Close the file the chain currently has open.
+        
+        Used in forked workers: the descriptor (and its seek offset) is shared
+        with the parent, so each worker has to open its own copy. The chain
+        forgets the closed file through the cleanup list and opens it again 
+        on the next LoadTree.
+        """
+        current_file = self.input_tree.tree.GetFile()
+        if current_file:
+            current_file.Close()
+        if self.input_tree.branch_binder:
+            self.input_tree.branch_binder.reset()
+    
+    def run_range(self, lo, hi, output, entry_cache=None, status_file=None):
+        """
+        Process entries [lo, hi) and write the result to `output`, and the
+        kept entries to `entry_cache` if they are being recorded.
+        Runs in a forked worker process.
+        """
+        self.release_input_file()
+        self.options.output = output
+        self.options.status_file = status_file
+        
+        chain = self.input_tree.tree
+        chain.LoadTree(lo)
+        self.last_tree = chain.GetTreeNumber()
+        self.initialize_counters()
+        self.start_progress(lo, hi)
+        
+        with timer("process entries [%i, %i)" % (lo, hi)) as t:
+            events = self.loop_range(lo, hi)
+        self.finish_progress(events)
+        
+        args = events, lo, hi, events / t.elapsed
+        log.info("Looped over %i events in [%i, %i) at %.2f events/sec" % args)
+        if entry_cache:
+            self.save_entry_cache(entry_cache)
+        self.finalize()
+    
+    def run_jobs(self, lo, hi):
+        """
+        Split [lo, hi) over `options.jobs` forked workers, each with its own
+        HistogramManager, then merge their outputs into `options.output`.
+        """
+        ranges = split_clusters(self.input_tree.tree, lo, hi, self.options.jobs)
+        ranges = [(job_lo, job_hi) for job_lo, job_hi in ranges if job_hi > job_lo]
+        outputs = [partial_filename(self.options.output, "job%i" % i)
+                   for i in xrange(len(ranges))]
+        entry_caches = status_files = [None] * len(ranges)
+        if self.kept_entries is not None:
+            entry_caches = ["%s.job%i" % (self.entry_cache, i)
+                            for i in xrange(len(ranges))]
+        if self.options.status_file:
+            status_files = ["%s.job%i" % (self.options.status_file, i)
+                            for i in xrange(len(ranges))]
+        
+        remove_stale_outputs(outputs)
+        log.info("Processing [%i, %i) with %i workers", lo, hi, len(ranges))
+        with timer("run %i workers" % len(ranges)):
+            pids = [fork_worker(self.run_range, job_lo, job_hi, output, cache,
+                                status_file)
+                    for (job_lo, job_hi), output, cache, status_file
+                    in zip(ranges, outputs, entry_caches, status_files)]
+            failed = wait_workers(pids)
+        
+        if failed:
+            raise RuntimeError("%i of %i workers failed. Partial outputs "
+                               "were left in place." % (len(failed), len(pids)))
+        
+        outputs = [output for output in outputs if exists(output)]
+        merge_outputs(unused_filename(self.options.output), outputs)
+        for output in outputs:
+            remove(output)
+        
+        if self.kept_entries is not None:
+            for entry_cache in entry_caches:
+                self.kept_entries.extend(load_entries(entry_cache))
+                remove(entry_cache)
+            self.save_entry_cache()
+        
     def run(self):
-        if self.specific_events:
+        if self.specific_events is not None:
             events = len(self.specific_events)
             log.info("Processing %i specific events..", events)
             with timer("perform analysis loop") as t:
-                for i in self.specific_events:
-                    self.input_tree.GetEntry(i)
-                    self.event(i, self.input_tree)
+                self.loop_specific_events(self.specific_events)
             args = events, events / t.elapsed
             log.info("Looped over %i events at %.2f events/sec" % args)
+            self.write_startup_profile()
             return
         
-        events = min(self.input_tree.tree.GetEntries(), self.options.limit)
-        log.info("Will process %i events." % events)
+        lo, hi = self.entry_range
+        log.info("Will process %i events." % (hi - lo))
+        
+        if self.options.jobs > 1:
+            self.run_jobs(lo, hi)
+            return
+            
+        self.start_progress(lo, hi)
         with timer("perform analysis loop") as t:
-            events = self.input_tree.loop(
-                self.event, lo=self.options.skip, 
-                hi=self.options.skip+self.options.limit)
+            events = self.loop_range(lo, hi)
+        self.finish_progress(events)
                 
         args = events, events / t.elapsed
         log.info("Looped over %i events at %.2f events/sec" % args)
+        self.save_entry_cache()
         self.finalize()
-
+        self.finish_checkpoints()
+        self.write_startup_profile()
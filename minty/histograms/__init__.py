@@ -5,6 +5,7 @@ import ROOT as R
 from array import array
 
 from manager import HistogramManager, AthenaHistogramManager
+from merge import merge_outputs
 
 import re
 
@@ -0,0 +1,27 @@
+"""
+Checkpoints are ordinary analysis outputs (see HistogramManager.snapshot)
+with one extra parameter: the last chain entry they include. A run started
+with --resume carries on from the entry after that and merges the checkpoint
+into its output at the end.
+"""
+
+import ROOT as R
+
+CHECKPOINT_ENTRY = "checkpoint_entry"
+
+def write_checkpoint_entry(filename, entry):
+    f = R.TFile.Open(filename, "UPDATE")
+    R.TParameter(long)(CHECKPOINT_ENTRY, entry).Write(CHECKPOINT_ENTRY,
+                                                       R.TObject.kOverwrite)
+    f.Close()
+
+def read_checkpoint_entry(filename):
+    f = R.TFile.Open(filename)
+    if not f or f.IsZombie():
+        raise RuntimeError("Couldn't open checkpoint: %s" % filename)
+    parameter = f.Get(CHECKPOINT_ENTRY)
+    if not parameter:
+        raise RuntimeError("%s isn't a checkpoint" % filename)
+    entry = parameter.GetVal()
+    f.Close()
+    return entry
@@ -172,6 +172,19 @@ class HistogramManager(object):
             else:
                 self.file.WriteObject(obj, name, "")
 
+    def snapshot(self, filename):
+        """
+        Write the current contents to `filename`. Unlike `save`, this leaves
+        the manager and the objects it holds as they are.
+        """
+        f = R.TFile(filename, "RECREATE")
+        for obj, name, subdir in sorted(self.store.values(), key=lambda (a, b, c): c):
+            d = f
+            for part in subdir:
+                d = d.GetDirectory(part) or d.mkdir(part)
+            d.WriteObject(obj, name, "")
+        f.Close()
+
     def write_object(self, name, what):
         self[name] = R.TObjString(dumps(what))
 
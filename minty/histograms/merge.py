@@ -0,0 +1,156 @@
+"""
+Merge several analysis outputs (as written by HistogramManager) into one.
+
+The result is what a single serial job over all of the inputs would have
+written:
+    * histograms are added
+    * parameters are summed, except for NON_ADDITIVE_PARAMETERS
+    * pickled lists are concatenated and pickled sets are unioned
+    * a file which is in several inputs (split between workers, or resumed
+      from a checkpoint) is only listed and counted once
+    * checkpoint bookkeeping is left out
+"""
+
+from cPickle import loads
+
+from logging import getLogger; log = getLogger("minty.histograms.merge")
+
+import ROOT as R
+
+from manager import HistogramManager
+from checkpoint import CHECKPOINT_ENTRY
+
+# Parameters which describe the output file itself (or the wrapper of the job
+# which wrote it) rather than the work done.
+NON_ADDITIVE_PARAMETERS = set(["jobs_files", "wrapper_objects", 
+                               "wrapper_bytes"])
+
+# The list of input files processed, the metadata of each of them (if it was
+# recorded) and their number
+FILE_LIST = "file_processed_list"
+FILE_METADATA = "file_metadata"
+FILE_COUNT = "processed_trees"
+
+def read_objects(directory, prefix=""):
+    """
+    Yield (path, object) for everything stored below `directory`
+    """
+    for key in directory.GetListOfKeys():
+        path = prefix + key.GetName()
+        obj = key.ReadObj()
+        if isinstance(obj, R.TDirectory):
+            for item in read_objects(obj, path + "/"):
+                yield item
+        else:
+            if hasattr(obj, "SetDirectory"):
+                obj.SetDirectory(0)
+            yield path, obj
+
+def is_parameter(obj):
+    return obj.ClassName().startswith("TParameter")
+
+def merge_pickled(name, a, b):
+    if isinstance(a, list):
+        return a + b
+    if isinstance(a, set):
+        return a | b
+    if isinstance(a, dict):
+        result = dict(a)
+        for key, value in b.iteritems():
+            if key in result:
+                value = merge_pickled(name, result[key], value)
+            result[key] = value
+        return result
+    if isinstance(a, (int, long, float)):
+        return a + b
+    log.warning("Don't know how to merge '%s' (%s), keeping the first",
+                name, type(a).__name__)
+    return a
+
+def unique_files(files, metadata):
+    """
+    Returns `files` without repeats (keeping the first), and `metadata` to 
+    match if it has an entry for each file.
+    """
+    paired = len(metadata) == len(files)
+    seen, result, result_metadata = set(), [], []
+    for i, name in enumerate(files):
+        if name in seen:
+            continue
+        seen.add(name)
+        result.append(name)
+        if paired:
+            result_metadata.append(metadata[i])
+    return result, result_metadata if paired else metadata
+
+def deduplicate_files(parameters, pickled):
+    """
+    Make the file lists of the merged output count each file once
+    """
+    for path in pickled.keys():
+        if path.split("/")[-1] != FILE_LIST:
+            continue
+        prefix = path[:-len(FILE_LIST)]
+        metadata_path = prefix + FILE_METADATA
+        files, metadata = unique_files(pickled[path], 
+                                       pickled.get(metadata_path, []))
+        if len(files) == len(pickled[path]):
+            continue
+        log.info("%i files were in more than one input", 
+                 len(pickled[path]) - len(files))
+        pickled[path] = files
+        if metadata_path in pickled:
+            pickled[metadata_path] = metadata
+        if prefix + FILE_COUNT in parameters:
+            parameters[prefix + FILE_COUNT] = len(files)
+
+def merge_outputs(destination, inputs):
+    """
+    Merge the analysis outputs `inputs` (in order) into `destination`
+    """
+    log.info("Merging %i outputs into %s", len(inputs), destination)
+    parameters, pickled, objects, order = {}, {}, {}, []
+
+    for filename in inputs:
+        f = R.TFile.Open(filename)
+        if not f or f.IsZombie():
+            raise RuntimeError("Couldn't open partial output: %s" % filename)
+
+        for path, obj in read_objects(f):
+            if path == CHECKPOINT_ENTRY:
+                continue
+            if path not in parameters and path not in pickled and path not in objects:
+                order.append(path)
+
+            if is_parameter(obj):
+                if path in parameters and path.split("/")[-1] in NON_ADDITIVE_PARAMETERS:
+                    continue
+                parameters[path] = parameters.get(path, 0) + obj.GetVal()
+
+            elif isinstance(obj, R.TObjString):
+                value = loads(obj.GetString().Data())
+                if path in pickled:
+                    value = merge_pickled(path, pickled[path], value)
+                pickled[path] = value
+
+            elif path in objects:
+                if not hasattr(obj, "Add"):
+                    log.warning("Can't merge '%s' (%s), keeping the first",
+                                path, obj.ClassName())
+                    continue
+                objects[path].Add(obj)
+            else:
+                objects[path] = obj
+        f.Close()
+    
+    deduplicate_files(parameters, pickled)
+
+    hm = HistogramManager(destination)
+    for path in order:
+        if path in parameters:
+            hm.write_parameter(path, parameters[path])
+        elif path in pickled:
+            hm.write_object(path, pickled[path])
+        else:
+            hm[path] = objects[path]
+    hm.finalize()
@@ -1,8 +1,14 @@
 from __future__ import with_statement
 
+from os import remove
+from os.path import exists, getsize
+
 from .options import parse_options
-from .utils import init_root
+from .utils import init_root, make_chain, timer
 from .utils.logger import log_level
+from .utils.parallel import (partial_filename, unused_filename, 
+                             remove_stale_outputs, fork_worker, wait_any)
+from .utils.startup import startup_profile
 
 from logging import DEBUG, getLogger; log = getLogger("minty.main")
 
@@ -16,12 +22,85 @@ def main(Analysis):
     with log_level(DEBUG):
         run(Analysis)
 
+def file_size(filename):
+    """
+    Size of `filename` in bytes, or 0 if it isn't a local file.
+    """
+    try:
+        return getsize(filename)
+    except OSError:
+        return 0
+
+def run_single_file(Analysis, options, filename, output, status_file=None):
+    """
+    Run `Analysis` over one file, writing the result to `output`.
+    Runs in a forked worker process.
+    """
+    input_tree = make_chain([filename], options.cache_size, 
+                            options.cache_learn_entries)
+    if not input_tree.GetEntries():
+        log.info("No entries in %s, skipping", filename)
+        return
+    options.output = output
+    options.status_file = status_file
+    options.input_files = [filename]
+    options.jobs = 1
+    Analysis(input_tree, options).run()
+
+def run_file_pool(Analysis, options):
+    """
+    Process each input file in its own worker, at most `options.jobs` at 
+    once. Files are handed out largest first, so that a free worker always
+    picks up the biggest remaining file. The partial outputs are merged into
+    `options.output` (or the first unused name after it, like a single job).
+    """
+    from .histograms import merge_outputs
+    
+    files = options.input_files
+    outputs = [partial_filename(options.output, "file%i" % i)
+               for i in xrange(len(files))]
+    pending = sorted(xrange(len(files)), key=lambda i: -file_size(files[i]))
+    running, failed = {}, []
+    
+    remove_stale_outputs(outputs)
+    log.info("Processing %i files with %i workers", len(files), options.jobs)
+    with timer("run file pool"):
+        while pending or running:
+            while pending and len(running) < options.jobs:
+                i = pending.pop(0)
+                status_file = None
+                if options.status_file:
+                    status_file = "%s.file%i" % (options.status_file, i)
+                pid = fork_worker(run_single_file, Analysis, options, 
+                                  files[i], outputs[i], status_file)
+                running[pid] = i
+            
+            pid, pid_failed = wait_any()
+            i = running.pop(pid)
+            if pid_failed:
+                log.error("Worker failed on %s", files[i])
+                failed.append(files[i])
+    
+    if failed:
+        raise RuntimeError("%i of %i files failed. Partial outputs were left "
+                           "in place." % (len(failed), len(files)))
+    
+    outputs = [output for output in outputs if exists(output)]
+    merge_outputs(unused_filename(options.output), outputs)
+    for output in outputs:
+        remove(output)
+
 def run(Analysis):
     from sys import argv
-    options, input_tree = parse_options(argv)
+    with startup_profile.phase("parse_options"):
+        options, input_tree = parse_options(argv)
         
     if options.shell_on_exception:
         from IPython.Shell import IPShellEmbed; IPShellEmbed(["-pdb"])
+    
+    if options.jobs > 1 and options.split_by == "files":
+        run_file_pool(Analysis, options)
+        return
         
     analysis = Analysis(input_tree, options)
     analysis.run()
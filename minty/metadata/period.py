@@ -3,18 +3,24 @@
 from os import listdir
 from os.path import join as pjoin
 from pkg_resources import resource_string, get_provider
-from yaml import dump, load
 
 import re
 import sys
 
-# run to period mapping
-RUN_TO_PERIOD = load(resource_string(__name__, "periods.yaml"))
+# run to period mapping, loaded by run_to_period
+RUN_TO_PERIOD = None
+
+def run_to_period():
+    global RUN_TO_PERIOD
+    if RUN_TO_PERIOD is None:
+        from yaml import load
+        RUN_TO_PERIOD = load(resource_string(__name__, "periods.yaml"))
+    return RUN_TO_PERIOD
 
 def period_from_run(run):
     if run < 152166:
         return "MC", (run, run)
-    for period, (first, last) in RUN_TO_PERIOD.items():
+    for period, (first, last) in run_to_period().items():
         if first <= run <= last:
             return period, (first, last)
     return "UNK", (run, run)
@@ -36,6 +42,7 @@ def generate_mapping():
     return mapping
 
 def update_periods_file():
+    from yaml import dump
     mapping = generate_mapping()
     
     path = get_provider(__name__).module_path
@@ -45,7 +52,7 @@ def update_periods_file():
 
 def check_mapping():
     mapping = generate_mapping()
-    if mapping != RUN_TO_PERIOD:
+    if mapping != run_to_period():
         print "Run-Period mapping is out of date"
         return 1
     return 0
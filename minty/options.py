@@ -53,8 +53,36 @@ def parse_options(argv):
     p.add_option("-s", "--obj-selection", type=str)
     p.add_option("--max-exception-count", type=int, default=10)
     p.add_option("--events", action="append", type=int, default=None)
+    p.add_option("--event-ids", action="append", type=str, default=None,
+                 metavar="RUN:EVENT")
+    p.add_option("--event-catalogue", type=str)
     p.add_option("--dump", action="store", type=str, default=None)
     p.add_option("--have-metadata", action="store_true")
+    p.add_option("-j", "--jobs", type=int, default=1)
+    p.add_option("--shard", type=str, metavar="I/N")
+    p.add_option("--split-by", type="choice", choices=["entries", "files"],
+                 default="entries")
+    p.add_option("--columnar", type=int, default=0, metavar="CHUNK_SIZE")
+    p.add_option("--bind-buffers", action="store_true")
+    p.add_option("--adaptive-capacity", action="store_true")
+    p.add_option("--lazy-read", action="store_true")
+    p.add_option("--branch-profile", type=str, metavar="DIRECTORY")
+    p.add_option("--profile-warmup", type=int, default=0, metavar="ENTRIES")
+    p.add_option("--cache-size", type=int, default=0, metavar="BYTES")
+    p.add_option("--cache-learn-entries", type=int, default=0)
+    p.add_option("--io-stats", action="store_true")
+    p.add_option("--preselect", type=str, metavar="EXPRESSION")
+    p.add_option("--entry-cache", type=str, metavar="DIRECTORY")
+    p.add_option("--selection-version", type=str, default="")
+    p.add_option("--prefetch", action="store_true")
+    p.add_option("--checkpoint-every", type=int, default=0, metavar="EVENTS")
+    p.add_option("--checkpoint-minutes", type=float, default=0)
+    p.add_option("--resume", action="store_true")
+    p.add_option("--status-file", type=str)
+    p.add_option("--status-interval", type=float, default=10, metavar="SECONDS")
+    p.add_option("--prefetch-bytes", type=int, default=64*1024*1024)
+    p.add_option("--profile-startup", type=str, metavar="FILE")
+    p.add_option("--cache-stats", action="store_true")
     
     # Used for conditionals
     p.add_option("--release", default="rel16")
@@ -62,15 +90,93 @@ def parse_options(argv):
     
     options, args = p.parse_args(argv)
     files = args[1:]
-    if not files:
+    if not files and not options.event_catalogue:
         p.error("Specify files to run on!")
     
-    actual_files = load_files(files)
+    if options.event_ids:
+        try:
+            options.event_ids = [tuple(int(x) for x in event_id.split(":"))
+                                 for event_id in options.event_ids]
+        except ValueError:
+            p.error("--event-ids should look like RUN:EVENT")
+        if any(len(event_id) != 2 for event_id in options.event_ids):
+            p.error("--event-ids should look like RUN:EVENT")
+    
+    if options.shard:
+        try:
+            index, count = map(int, options.shard.split("/"))
+        except ValueError:
+            p.error("--shard should look like I/N")
+        if not 0 <= index < count:
+            p.error("--shard I/N needs 0 <= I < N")
+        options.shard = index, count
+    
+    if options.shard and options.split_by == "files":
+        p.error("--shard can't be combined with --split-by files")
+    
+    if options.event_catalogue and (options.events or not options.event_ids):
+        p.error("--event-catalogue is used with --event-ids (only)")
+    
+    specific_events = options.events or options.event_ids
+    
+    if options.jobs > 1 and (specific_events or options.dump or
+                             options.run_specific_output):
+        p.error("--jobs can't be combined with --events, --dump or "
+                "--run-specific-output")
+    
+    if options.columnar and (specific_events or options.run_specific_output):
+        p.error("--columnar can't be combined with --events or "
+                "--run-specific-output")
+    
+    if options.preselect and (specific_events or options.columnar):
+        p.error("--preselect can't be combined with --events or --columnar")
+    
+    if options.entry_cache and (specific_events or options.columnar):
+        p.error("--entry-cache can't be combined with --events or --columnar")
+    
+    if options.entry_cache and not isdir(options.entry_cache):
+        p.error("--entry-cache should be an existing directory")
+    
+    checkpoints = (options.checkpoint_every or options.checkpoint_minutes or 
+                   options.resume)
+    if checkpoints and (options.jobs > 1 or specific_events or options.columnar
+                        or options.run_specific_output or options.dump):
+        # (--dump: the events to dump aren't part of a checkpoint)
+        p.error("Checkpoints can't be combined with --jobs, --events, "
+                "--columnar, --run-specific-output or --dump")
+    
+    if options.columnar and options.branch_profile:
+        p.error("--branch-profile can't be combined with --columnar")
+    
+    if options.columnar and options.adaptive_capacity:
+        p.error("--adaptive-capacity can't be combined with --columnar")
+    
+    if options.branch_profile and not isdir(options.branch_profile):
+        p.error("--branch-profile should be an existing directory")
+    
+    
+    if options.split_by == "files" and options.skip:
+        p.error("--skip doesn't make sense with --split-by files")
+    
+    if options.event_catalogue:
+        # Only open the files which have the events
+        from .utils.event_catalogue import EventCatalogue
+        catalogue = EventCatalogue(options.event_catalogue)
+        selected, options.events = catalogue.select(options.event_ids)
+        if not selected:
+            p.error("None of the --event-ids are in the catalogue")
+        actual_files = [filename for _, filename in selected]
+        options.event_ids = None
+    else:
+        actual_files = load_files(files)
     log.info("Operating on the following files:")
     log.info(pformat(actual_files[:10]))
     if len(actual_files) > 10:
         log.info("[skipped %i filenames]" % (len(actual_files) - 20))
         log.info(pformat(actual_files[-10:]))
+    
+    options.input_files = actual_files
         
     from .utils import make_chain
-    return options, make_chain(actual_files)
+    return options, make_chain(actual_files, options.cache_size,
+                               options.cache_learn_entries)
@@ -0,0 +1,126 @@
+#! /usr/bin/env python
+"""
+Build an event catalogue of a dataset (see minty.utils.event_catalogue), or
+use one to skim events.
+
+    minty-event-catalogue build -o data11.catalogue -j 8 input.txt
+    minty-event-catalogue skim -c data11.catalogue -o skim.root 180164:1234 ...
+"""
+
+from __future__ import with_statement
+
+from argparse import ArgumentParser
+from array import array
+from heapq import merge
+from itertools import izip
+from os import remove
+from os.path import getsize
+
+from logging import getLogger; log = getLogger("minty.tools.event_catalogue")
+
+import ROOT as R
+
+from minty.options import load_files
+from minty.utils import find_tree_name, timer
+from minty.utils.event_catalogue import write_catalogue, FILE_SHIFT
+from minty.utils.event_index import build_index, save_index
+from minty.utils.parallel import fork_worker, wait_any
+from minty.utils.skimtree import skim_events
+
+BLOCK = 65536
+
+def event_branches(filename, tree_name):
+    """
+    The names of the run and event number branches
+    """
+    f = R.TFile.Open(filename)
+    tree = f.Get(tree_name)
+    run, event = "RunNumber", "EventNumber"
+    if not tree.GetBranch(run):
+        run, event = "Run", "Event"
+    f.Close()
+    return run, event
+
+def scan_file(filename, tree_name, branches, part):
+    keys, entries = build_index(filename, tree_name, *branches)
+    save_index(part, keys, entries)
+
+def scan_files(files, tree_name, branches, parts, jobs):
+    """
+    Index each of `files` into the corresponding `parts`, `jobs` at a time
+    """
+    pending, running, failed = range(len(files)), {}, []
+    while pending or running:
+        while pending and len(running) < jobs:
+            i = pending.pop(0)
+            pid = fork_worker(scan_file, files[i], tree_name, branches, parts[i])
+            running[pid] = i
+        pid, pid_failed = wait_any()
+        i = running.pop(pid)
+        if pid_failed:
+            failed.append(files[i])
+    if failed:
+        raise RuntimeError("Couldn't scan %i files: %r" % (len(failed), failed))
+
+def read_part(part, number):
+    """
+    Yield (key, location) from an index written by scan_file, a block at a
+    time
+    """
+    count = getsize(part) // 16
+    location = number << FILE_SHIFT
+    with open(part, "rb") as key_fd:
+        with open(part, "rb") as entry_fd:
+            entry_fd.seek(count * 8)
+            for start in xrange(0, count, BLOCK):
+                size = min(BLOCK, count - start)
+                keys, entries = array("L"), array("l")
+                keys.fromfile(key_fd, size)
+                entries.fromfile(entry_fd, size)
+                for key, entry in izip(keys, entries):
+                    yield key, location | entry
+
+def build(args):
+    files = load_files(args.input)
+    tree_name = find_tree_name(files[0])
+    branches = event_branches(files[0], tree_name)
+    parts = ["%s.part%i" % (args.output, i) for i in xrange(len(files))]
+
+    with timer("scan %i files" % len(files)):
+        scan_files(files, tree_name, branches, parts, args.jobs)
+
+    with timer("write %s" % args.output):
+        sizes = [(getsize(part) // 16, filename)
+                 for part, filename in izip(parts, files)]
+        records = merge(*[read_part(part, i) for i, part in enumerate(parts)])
+        count = write_catalogue(args.output, tree_name, sizes, records)
+    log.info("Catalogued %i events in %i files", count, len(files))
+
+    for part in parts:
+        remove(part)
+
+def skim(args):
+    ids = [tuple(int(x) for x in event_id.split(":")) for event_id in args.ids]
+    skim_events(args.output, args.catalogue, ids)
+
+def main():
+    parser = ArgumentParser(description="Find events by (run, event) number")
+    commands = parser.add_subparsers()
+
+    p = commands.add_parser("build", help="Build a catalogue")
+    p.add_argument("-o", "--output", default="events.catalogue")
+    p.add_argument("-j", "--jobs", type=int, default=1)
+    p.add_argument("input", nargs="+")
+    p.set_defaults(function=build)
+
+    p = commands.add_parser("skim", help="Skim events into a new file")
+    p.add_argument("-c", "--catalogue", required=True)
+    p.add_argument("-o", "--output", default="skim.root")
+    p.add_argument("ids", nargs="+", metavar="RUN:EVENT")
+    p.set_defaults(function=skim)
+
+    args = parser.parse_args()
+    args.function(args)
+
+if __name__ == "__main__":
+    main()
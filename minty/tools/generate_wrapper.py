@@ -47,7 +47,7 @@ def main(options, treename, input_file):
 
 if __name__ == "__main__":
     import sys
-    init_root()
+    init_root(quiet=True)
     from optparse import OptionParser
     from IPython.Shell import IPShellEmbed; ip = IPShellEmbed(["-pdb"])
     optparser = OptionParser()
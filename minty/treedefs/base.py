@@ -14,19 +14,54 @@ tuple is "{__rootname__}_loose". For tuples of type "pau", it's ph_isPhotonLoose
 
 from logging import getLogger; log = getLogger("minty.treedefs")
 
-from math import tanh, cosh, sinh, asinh
+from itertools import islice
+from math import tanh, cos, sin, cosh, sinh, asinh, sqrt
 
 from pytuple.readtuple import make_wrapper
 from pytuple.treeinfo import treeinfo as TI
 from pytuple.Fourvec import Fourvec_All, Fourvec_PtEtaPhiE
 
-from PhotonIDTool import PhotonIDTool
-from OQMaps import check_photon, check_electron
-from EnergyRescalerTool import v16_E_correction
-
 import ROOT as R
 
-from ..utils import event_cache
+from ..utils import event_cache, deferred_import, memoize
+
+from .robust_id import (PhotonIDTool, robust_id_batch, robust_id_decisions,
+                        load_batch)
+from .rescaling import (v16_energy_correction, v16_object_energies, 
+                        v16_fourvecs, load_batch as load_rescaling_batch)
+
+# These are big, so they are only imported when first used
+check_photon = deferred_import("OQMaps", "check_photon")
+check_electron = deferred_import("OQMaps", "check_electron")
+
+# The results of these only depend on their arguments, which repeat a lot in
+# MC with overlaid events, so they are remembered across events.
+memoized_check_photon = memoize(name="OQMaps.check_photon")(check_photon)
+memoized_check_electron = memoize(name="OQMaps.check_electron")(check_electron)
+
+@event_cache
+def event_robust_decisions(event):
+    """
+    {id(photon): (loose, tight, isEM)} for the photons of `event`, evaluated
+    in one batch
+    """
+    photons = event.photons
+    decisions = robust_id_batch([p.robust_shower_shapes for p in photons])
+    return dict(zip(map(id, photons), decisions))
+
+@event_cache
+def event_v16_energies(event, collection, n):
+    """
+    {id(object): v16 corrected energy} for the objects of `collection` (e.g.
+    "photons") of `event`, corrected in one batch
+    """
+    objects = getattr(event, collection)
+    if not objects:
+        return {}
+    # The same rescaler as the objects use one at a time
+    rescaler = objects[0]._v16_energy_rescaler
+    energies = v16_object_energies(rescaler, objects, n)
+    return dict(zip(map(id, objects), energies))
 
 from .conditional import HasConditionals, data10, data11, rel15, rel16
 
@@ -82,17 +117,93 @@ def naming(*args, **kwargs):
             res = varname
         #print "Created new ROOT branch name: ", rootname, leafname, res
         return res
+    # Lets treedefs.layout find the naming rule attached to a descriptor
+    functor.is_naming = True
     return functor
 
 def pairs(inputs):
-    if len(inputs) < 2:
-        return
-    for i, o1 in enumerate(inputs):
-        for o2 in inputs[i+1:]:
-            yield o1, o2
+    n = len(inputs)
+    for i in xrange(n - 1):
+        o1 = inputs[i]
+        for j in xrange(i + 1, n):
+            yield o1, inputs[j]
             
 def by_pt(objects):
     return sorted(objects, key=lambda o: o.pt)
+
+def pair_mass(k1, k2):
+    """
+    Invariant mass of two objects given as (pt, eta, phi, E)
+    """
+    pt1, eta1, phi1, E1 = k1
+    pt2, eta2, phi2, E2 = k2
+    px = pt1 * cos(phi1) + pt2 * cos(phi2)
+    py = pt1 * sin(phi1) + pt2 * sin(phi2)
+    pz = pt1 * sinh(eta1) + pt2 * sinh(eta2)
+    E = E1 + E2
+    return sqrt(max(0., E*E - px*px - py*py - pz*pz))
+
+class PairView(object):
+    """
+    The pairs of `objects`, made as they are asked for. Objects are ordered
+    by decreasing pt and pairs by (leading, subleading) position in that 
+    order, so the first pair is the two leading objects.
+    """
+    def __init__(self, objects):
+        self.objects = sorted(objects, key=lambda o: o.pt, reverse=True)
+        self._kinematics = None
+    
+    def __len__(self):
+        n = len(self.objects)
+        return n * (n - 1) // 2
+    
+    def __iter__(self):
+        return pairs(self.objects)
+    
+    def leading(self):
+        "The leading pair, or None"
+        if len(self.objects) < 2:
+            return None
+        return self.objects[0], self.objects[1]
+    
+    def top(self, k):
+        "The first `k` pairs"
+        return list(islice(self, k))
+    
+    def kinematics(self):
+        """
+        (pt, eta, phi, E) of each object, and the largest E of the objects
+        from each position onwards
+        """
+        if self._kinematics is None:
+            values = [(o.pt, o.eta, o.phi, o.E) for o in self.objects]
+            max_after, largest = [0.] * (len(values) + 1), 0.
+            for i in xrange(len(values) - 1, -1, -1):
+                largest = max(largest, values[i][3])
+                max_after[i] = largest
+            self._kinematics = values, max_after
+        return self._kinematics
+    
+    def in_mass_window(self, lo, hi):
+        """
+        Yield (o1, o2, mass) for the pairs with lo <= mass <= hi, in order.
+        
+        The mass of a pair can't be more than the sum of its energies, which
+        is bounded using the largest energy of the objects still to come: 
+        once that is below `lo`, the remaining pairs are skipped.
+        """
+        values, max_after = self.kinematics()
+        objects, n = self.objects, len(values)
+        for i in xrange(n - 1):
+            if max_after[i] + max_after[i + 1] < lo:
+                return
+            k1 = values[i]
+            for j in xrange(i + 1, n):
+                if k1[3] + max_after[j] < lo:
+                    break
+                mass = pair_mass(k1, values[j])
+                if lo <= mass <= hi:
+                    yield objects[i], objects[j], mass
             
 class Global(object):
     RunNumber = TI.int(naming(pau="Run"))
@@ -110,14 +221,33 @@ class Global(object):
         return (self.RunNumber, self.LumiBlock) in self._grl
         
     @property
-    @event_cache
+    @event_cache.per_instance
     def diphotons(self):
         return list(pairs(by_pt(self._event.photons)))
     
     @property
-    @event_cache
+    @event_cache.per_instance
     def dielectrons(self):
         return list(pairs(by_pt(self._event.electrons)))
+    
+    @property
+    @event_cache.per_instance
+    def photon_pairs(self):
+        return PairView(self._event.photons)
+    
+    @property
+    @event_cache.per_instance
+    def electron_pairs(self):
+        return PairView(self._event.electrons)
+    
+    def v16_corrections(self, collection="photons", n=0):
+        """
+        The v16 corrected four-vectors of the objects of `collection`, as a
+        FourvecArray (see rescaling)
+        """
+        objects = getattr(self._event, collection)
+        energies = event_v16_energies(self._event, collection, n)
+        return v16_fourvecs(objects, [energies[id(o)] for o in objects])
 
 class Particle(Fourvec_PtEtaPhiE):
     "Defines an object with (pt, eta, phi, E) available)."
@@ -188,7 +318,7 @@ class EGamma(Particle, HasConditionals):
     
     @data10
     @property
-    @event_cache
+    @event_cache.per_instance
     def my_oq(self):
         run = self._event.RunNumber
         if run < 152166:
@@ -353,16 +483,20 @@ class Photon(EGamma):
     EF_matchPass = TI.int
     isConv  = TI.bool
     
-    oq_function = check_photon
+    oq_function = memoized_check_photon
     
     @property
     def pt_via_clE_etas2(self):
         return self.cl.E / cosh(self.etas2)
     
     @property
-    @event_cache
+    @event_cache.per_instance
     def robust_idtool(self):
-        return PhotonIDTool(
+        return PhotonIDTool(*self.robust_shower_shapes)
+    
+    @property
+    def robust_shower_shapes(self):
+        return (
             self.et, self.etas2,
             self.Ethad1, self.Ethad,
             self.E277, self.E237, self.E233,
@@ -394,23 +528,30 @@ class Photon(EGamma):
     def my_tight(self):
         return self.tight
     
+    @property
+    @event_cache.per_instance
+    def robust_decisions(self):
+        if load_batch():
+            decisions = event_robust_decisions(self._event).get(id(self))
+            if decisions is not None:
+                return decisions
+        return robust_id_decisions(*self.robust_shower_shapes)
+    
     @property
     def robust_loose(self):
-        return self.robust_idtool.PhotonCutsLoose2()
+        return self.robust_decisions[0]
     
     @property
-    @event_cache
     def robust_tight(self):
-        return self.robust_idtool.PhotonCutsTight(3)
+        return self.robust_decisions[1]
         
     @property
     def ambiguity_resolved(self):
         return not (self.isEM & AmbiguityResolution_Photon_Mask)
     
     @property
-    @event_cache
     def robust_isEM(self):
-        return self.robust_idtool.isEM(3)
+        return self.robust_decisions[2]
     
     @property
     def jet(self):
@@ -430,12 +571,18 @@ class Photon(EGamma):
         # For electrons:
         #et = cl_e/cosh(trk_eta) if (nSCT + nPix) >= 4) otherwise  et = cl_et 
         
+        if load_rescaling_batch(self._v16_energy_rescaler):
+            energies = event_v16_energies(self._event, "photons", n)
+            energy = energies.get(id(self))
+            if energy is not None:
+                return energy
+        
         cl = self.cl
         E, phi = cl.E, cl.phi
         etas2 = self.etas2
         cl_et = cl.E / cosh(etas2)
-        aEC = self._v16_energy_rescaler.applyEnergyCorrection
-        return aEC(etas2, phi, E, cl_et, n, self._part_type)
+        return v16_energy_correction(self._v16_energy_rescaler, 
+                                     etas2, phi, E, cl_et, n, self._part_type)
         
     def v16_corrections(self):
         E_corrected = self.v16_E_corrected()
@@ -504,7 +651,7 @@ class Electron(EGamma):
     particle = "electron"
     _part_type = "ELECTRON"
     
-    oq_function = check_electron
+    oq_function = memoized_check_electron
     
     @property
     def hit_dependent_pt(self):
@@ -0,0 +1,333 @@
+"""
+Bind the branches behind the wrapped objects to preallocated buffers.
+
+Scalar branches are bound with SetBranchAddress to a one element array.array
+and std::vector branches to a std::vector owned here, so GetEntry fills them
+in place. The descriptors of the wrapped objects are then replaced by plain
+getters which index those buffers, instead of going through PyROOT's tree
+attribute lookup on every access.
+
+In lazy mode (see BufferBinder.load_entry) the event loop only calls 
+LoadTree, and each bound branch is read with TBranch::GetEntry the first time
+one of its getters is used in that event. Branches which aren't bound here but
+are enabled on the tree are still read for every entry, so everything the
+wrapper reads by itself stays up to date.
+
+The binder can also watch the getters, to find out which branches are really
+read (see treedefs.profile), and switch off the branches which aren't. A
+watching getter replaces itself with the plain one on first use, so it costs
+nothing after that.
+
+The wrapper gives each object in a list its own class (see
+setup_pau_trigger_info in treedefs.egamma), which is what lets a getter for
+instance `i` be installed on type(instance) with `i` built in. If a
+collection's objects turn out to share a class it is left alone.
+"""
+
+from array import array
+
+from logging import getLogger; log = getLogger("minty.treedefs.buffers")
+
+import ROOT as R
+
+from .layout import tree_layout
+
+SCALAR_TYPECODES = {
+    "Char_t" : "b", "UChar_t" : "B", "Bool_t"   : "B",
+    "Short_t": "h", "UShort_t": "H",
+    "Int_t"  : "i", "UInt_t"  : "I",
+    "Long64_t": "l", "ULong64_t": "L",
+    "Float_t": "f", "Double_t": "d",
+}
+
+VECTOR_TYPES = {
+    "vector<float>"       : "float",
+    "vector<double>"      : "double",
+    "vector<int>"         : "int",
+    "vector<unsigned int>": "unsigned int",
+    "vector<short>"       : "short",
+}
+
+class BranchBuffer(object):
+    """
+    Storage for one branch, bound to it with SetBranchAddress
+    """
+    def __init__(self, binder, name, typename):
+        self.binder = binder
+        self.name = name
+        self.is_vector = typename in VECTOR_TYPES
+        if self.is_vector:
+            self.buffer = R.std.vector(VECTOR_TYPES[typename])()
+        else:
+            self.buffer = array(SCALAR_TYPECODES[typename], [0])
+        binder.tree.SetBranchAddress(name, self.buffer)
+        
+        # Used in lazy mode. `branch` belongs to the current tree of the chain
+        self.branch = None
+        self.generation = -1
+        
+        # (class, attribute, getter) for each getter installed for this branch
+        self.installs = []
+        self.accessed = self.pruned = False
+    
+    def load(self):
+        """
+        Read this branch for the current entry, unless that already happened
+        """
+        binder = self.binder
+        if self.generation != binder.generation:
+            self.generation = binder.generation
+            self.branch.GetEntry(binder.entry)
+
+def make_getter(branch_buffer, index, lazy=False):
+    """
+    A descriptor getter reading element `index` of `branch_buffer`
+    """
+    buffer = branch_buffer.buffer
+    if not branch_buffer.is_vector:
+        index = 0
+    
+    if lazy:
+        load = branch_buffer.load
+        def getter(_):
+            load()
+            return buffer[index]
+    else:
+        def getter(_):
+            return buffer[index]
+    return getter
+
+def make_watch_getter(binder, branch_buffer, getter):
+    """
+    A getter which tells `binder` about the first access to `branch_buffer`,
+    then behaves like `getter`.
+    """
+    def watch_getter(instance):
+        binder.touch(branch_buffer)
+        return getter(instance)
+    return watch_getter
+
+def walk(instance, names):
+    """
+    Follow attributes `names` from `instance`, e.g. ("cl",) => instance.cl
+    """
+    for name in names:
+        instance = getattr(instance, name)
+    return instance
+
+def has_own_classes(instances, layout):
+    """
+    True if every instance (and every nested instance) has its own class
+    """
+    seen = set()
+    prefixes = set(path[:-1] for path, _, _ in layout)
+    for instance in instances:
+        for prefix in prefixes:
+            cls = type(walk(instance, prefix))
+            if cls in seen:
+                return False
+            seen.add(cls)
+    return True
+
+class BufferBinder(object):
+    """
+    Owns the buffers bound to `tree` (a chain) and installs getters for them.
+    """
+    def __init__(self, tree, lazy=False):
+        self.tree = tree
+        self.lazy = lazy
+        self.buffers = {}
+        
+        # Lazy mode state: the local entry in the current tree, a counter
+        # which changes with every entry, and the branches read eagerly.
+        self.entry = -1
+        self.generation = 0
+        self.tree_number = -1
+        self.eager_branches = []
+        
+        # Pruned branches which turned out to be used after all
+        self.unprofiled = set()
+        self.recording = False
+
+    def get_buffer(self, branch, typename):
+        if branch not in self.buffers:
+            self.buffers[branch] = BranchBuffer(self, branch, typename)
+        return self.buffers[branch]
+    
+    def reset(self):
+        """
+        Forget the current tree, e.g. after its file was closed
+        """
+        self.tree_number = -1
+    
+    def switch_tree(self, tree):
+        """
+        Called when the chain moves onto a new tree: find the TBranches of
+        the lazy buffers and the enabled branches which must be read eagerly.
+        """
+        for branch_buffer in self.buffers.itervalues():
+            branch_buffer.branch = tree.GetBranch(branch_buffer.name)
+            branch_buffer.generation = -1
+        
+        self.eager_branches = [branch for branch in tree.GetListOfBranches()
+                               if branch.GetName() not in self.buffers and
+                               tree.GetBranchStatus(branch.GetName())]
+        log.debug("Lazy reading %i branches, %i read eagerly", 
+                  len(self.buffers), len(self.eager_branches))
+    
+    def load_entry(self, i):
+        """
+        Lazy mode replacement for GetEntry: make `i` the current entry
+        without reading the bound branches. Returns the local entry number.
+        """
+        tree = self.tree
+        entry = tree.LoadTree(i)
+        if entry < 0:
+            return entry
+        
+        if tree.GetTreeNumber() != self.tree_number:
+            self.tree_number = tree.GetTreeNumber()
+            self.switch_tree(tree.GetTree())
+        
+        self.entry = entry
+        self.generation += 1
+        for branch in self.eager_branches:
+            branch.GetEntry(entry)
+        return entry
+    
+    def install(self, branch_buffer, watch=False):
+        """
+        (Re)install the getters of `branch_buffer`, watching ones if `watch`
+        """
+        for cls, name, getter in branch_buffer.installs:
+            if watch:
+                getter = make_watch_getter(self, branch_buffer, getter)
+            setattr(cls, name, property(getter))
+    
+    def touch(self, branch_buffer):
+        """
+        First access to a watched branch: record it, turn the branch back on
+        if it was pruned, and go back to the plain getters.
+        """
+        branch_buffer.accessed = True
+        if branch_buffer.pruned:
+            name = branch_buffer.name
+            log.warning("Branch %s isn't in the branch profile, re-enabling it",
+                        name)
+            branch_buffer.pruned = False
+            self.unprofiled.add(name)
+            self.tree.SetBranchStatus(name, 1)
+            if not self.lazy:
+                # The current entry was read without it
+                tree = self.tree.GetTree()
+                tree.GetBranch(name).GetEntry(tree.GetReadEntry())
+        self.install(branch_buffer)
+    
+    def watched(self, branch_buffer):
+        """
+        Whether the getters of `branch_buffer` should watch it, because it
+        was pruned or it is being recorded and hasn't been used yet
+        """
+        return branch_buffer.pruned or (self.recording and 
+                                        not branch_buffer.accessed)
+    
+    def start_recording(self):
+        """
+        Watch every bound branch. See `accessed`.
+        """
+        self.recording = True
+        for branch_buffer in self.buffers.itervalues():
+            branch_buffer.accessed = False
+            self.install(branch_buffer, watch=True)
+    
+    def reapply_pruning(self):
+        """
+        Switch the pruned branches off again, e.g. after wrapping the tree
+        again turned them back on
+        """
+        for name, branch_buffer in self.buffers.iteritems():
+            if branch_buffer.pruned:
+                self.tree.SetBranchStatus(name, 0)
+    
+    def accessed(self):
+        """
+        Names of the branches read since start_recording
+        """
+        return set(name for name, branch_buffer in self.buffers.iteritems()
+                   if branch_buffer.accessed)
+    
+    def prune(self, profile):
+        """
+        Switch off the bound branches which aren't in `profile`. Should one 
+        of them be used anyway, it is switched back on at that point.
+        Returns the number of branches switched off.
+        """
+        pruned = 0
+        for name, branch_buffer in self.buffers.iteritems():
+            if name in profile:
+                continue
+            self.tree.SetBranchStatus(name, 0)
+            branch_buffer.pruned = True
+            self.install(branch_buffer, watch=True)
+            pruned += 1
+        return pruned
+    
+    def loop(self, wrapped_tree, function, lo, hi):
+        """
+        Lazy mode counterpart of the wrapper's loop. Returns the number of 
+        entries processed.
+        """
+        hi = min(hi, self.tree.GetEntries())
+        processed = 0
+        for i in xrange(lo, hi):
+            if self.load_entry(i) < 0:
+                break
+            function(i, wrapped_tree)
+            processed += 1
+        return processed
+
+    def bind(self, instances, layout, vectors):
+        """
+        Install getters on each of `instances` (element i reads index i) for
+        the members in `layout`. `vectors` selects vector or scalar branches.
+        """
+        if vectors and not has_own_classes(instances, layout):
+            log.warning("Objects share a class, can't bind their branches: %r",
+                        type(instances[0]).__name__)
+            return 0
+
+        supported = VECTOR_TYPES if vectors else SCALAR_TYPECODES
+        layout = [(path, branch, typename) for path, branch, typename in layout
+                  if typename in supported]
+
+        for index, instance in enumerate(instances):
+            for path, branch, typename in layout:
+                branch_buffer = self.get_buffer(branch, typename)
+                getter = make_getter(branch_buffer, index, self.lazy)
+                cls = type(walk(instance, path[:-1]))
+                branch_buffer.installs.append((cls, path[-1], getter))
+                if self.watched(branch_buffer):
+                    getter = make_watch_getter(self, branch_buffer, getter)
+                setattr(cls, path[-1], property(getter))
+        return len(layout)
+
+def bind_buffers(tt, t, global_class, collections, lazy=False, binder=None):
+    """
+    Bind the branches of the Global object and of each of `collections`
+    ([(name, class, capacity)], as added to `tt`) to buffers. An existing
+    `binder` (of an earlier wrapper of `t`) keeps its buffers and their 
+    state.
+    """
+    if binder is None:
+        binder = BufferBinder(t, lazy)
+    
+    bound = binder.bind([tt.Global_obj._instance],
+                        tree_layout(t, global_class), vectors=False)
+    log.info("Bound %i branches of %s", bound, global_class.__name__)
+
+    for name, cls, capacity in collections:
+        instances = getattr(tt, "%s_list" % name)._instances
+        bound = binder.bind(instances, tree_layout(t, cls), vectors=True)
+        log.info("Bound %i branches of %s", bound, name)
+
+    return binder
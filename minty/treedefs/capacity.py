@@ -0,0 +1,117 @@
+"""
+Size the wrapped collections from the multiplicities in the input, rather
+than giving each a fixed number of objects (most of which are never used).
+
+The multiplicity of a collection is the maximum of its count branch (e.g.
+"ph_n"), which is found by scanning the branch, or from a sidecar next to the
+file: "<file>.multiplicity", which is reused as long as it is newer than the
+file. A collection gets some headroom on top of the largest multiplicity seen.
+"""
+
+from __future__ import with_statement
+
+import json
+
+from sys import getsizeof
+
+from logging import getLogger; log = getLogger("minty.treedefs.capacity")
+
+from ..utils.sidecar import sidecar_value
+from .layout import class_rootname
+
+SIDECAR_SUFFIX = ".multiplicity"
+CAPACITY_STEP = 16
+
+def count_branch(cls):
+    return "%s_n" % class_rootname(cls)
+
+def capacity_for(maximum):
+    """
+    The capacity for a collection of up to `maximum` objects: rounded up to
+    the next multiple of CAPACITY_STEP, leaving at least 25% headroom
+    """
+    wanted = maximum + max(1, maximum // 4)
+    return -(-wanted // CAPACITY_STEP) * CAPACITY_STEP
+
+def scan_multiplicities(tree, branches):
+    """
+    {branch: maximum} for those of `branches` which `tree` (not a chain) has.
+    The branches are read again at the current entry afterwards.
+    """
+    entry = tree.GetReadEntry()
+    result = {}
+    for name in branches:
+        branch = tree.GetBranch(name)
+        if not branch:
+            continue
+        result[name] = int(tree.GetMaximum(name))
+        if entry >= 0:
+            branch.GetEntry(entry)
+    return result
+
+def tree_multiplicities(tree, branches):
+    """
+    Like scan_multiplicities, but using the sidecar of the file of `tree`
+    where possible.
+    """
+    def load(sidecar):
+        with open(sidecar) as fd:
+            saved = json.load(fd)
+        if not all(name in saved for name in branches):
+            return None
+        return dict((name, saved[name]) for name in branches
+                    if saved[name] is not None)
+    
+    def save(sidecar, result):
+        # Branches the tree doesn't have are saved as None
+        with open(sidecar, "w") as fd:
+            json.dump(dict((name, result.get(name)) for name in branches), fd)
+    
+    return sidecar_value(tree.GetCurrentFile().GetName(), SIDECAR_SUFFIX, load,
+                         lambda: scan_multiplicities(tree, branches), save,
+                         "multiplicities")
+
+def needed_capacities(tree, collections):
+    """
+    {name: capacity} for each of `collections` ([(name, class, capacity)])
+    from the multiplicities in `tree`. Collections without a count branch 
+    keep their capacity.
+    """
+    branches = dict((name, count_branch(cls)) for name, cls, _ in collections)
+    maxima = tree_multiplicities(tree, sorted(branches.values()))
+    capacities = {}
+    for name, cls, capacity in collections:
+        if branches[name] in maxima:
+            capacity = capacity_for(maxima[branches[name]])
+        capacities[name] = capacity
+    return capacities
+
+def first_tree_capacities(chain, collections):
+    """
+    The capacities needed for the first tree of `chain`
+    """
+    chain.LoadTree(0)
+    capacities = needed_capacities(chain.GetTree(), collections)
+    log.info("Collection capacities: %s", ", ".join(
+        "%s=%i" % (name, capacities[name]) for name, _, _ in collections))
+    return capacities
+
+def wrapper_footprint(tt, collections):
+    """
+    An estimate of the memory taken by the wrapped objects of `collections`, 
+    as {name: (objects, bytes)}. Each object has its own class (see 
+    treedefs.buffers), which is counted with it.
+    """
+    result = {}
+    for name, _, _ in collections:
+        instances = getattr(tt, "%s_list" % name)._instances
+        size = 0
+        for instance in instances:
+            cls = type(instance)
+            size += getsizeof(instance) + getsizeof(cls)
+            if hasattr(instance, "__dict__"):
+                size += getsizeof(instance.__dict__)
+            size += sum(getsizeof(value) for value in vars(cls).itervalues())
+            size += getsizeof(dict(vars(cls)))
+        result[name] = len(instances), size
+    return result
@@ -0,0 +1,278 @@
+"""
+Columnar access to the tree, many events at a time.
+
+Rather than wrapping one event at a time, a chunk of events is read into
+numpy arrays (one TTree::Draw per branch, evaluated in C++). The arrays are
+exposed under the same attribute names as the wrapper, with branch names
+resolved by treedefs.layout, so the naming(...) rules still apply:
+
+    chunk.RunNumber      # array, one value per event
+    chunk.photons.pt     # JaggedArray, one row of photons per event
+    chunk.photons.cl.E   # instances nest as they do on the wrapper
+
+Only tree variables are available: python properties such as `Photon.et`
+have to be rewritten in terms of the arrays, e.g.
+    chunk.photons.cl.E / numpy.cosh(chunk.photons.etas2)
+"""
+
+import operator
+
+import numpy
+
+from .base import Global
+from .egamma import collection_classes
+from .layout import tree_layout
+
+class JaggedArray(object):
+    """
+    Rows of varying length, stored as one flat `content` array and `offsets`,
+    so that row i is content[offsets[i]:offsets[i+1]].
+
+    Arithmetic, comparisons and numpy ufuncs act on the content and keep the
+    row structure. The other operand may be a JaggedArray with the same
+    structure, a scalar, or an array with one value per row.
+    """
+    __array_priority__ = 100
+
+    def __init__(self, content, offsets):
+        self.content = content
+        self.offsets = offsets
+
+    @classmethod
+    def from_counts(cls, content, counts):
+        offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+        numpy.cumsum(counts, out=offsets[1:])
+        return cls(content, offsets)
+
+    @property
+    def counts(self):
+        return numpy.diff(self.offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __iter__(self):
+        content, offsets = self.content, self.offsets
+        for i in xrange(len(self)):
+            yield content[offsets[i]:offsets[i+1]]
+
+    def __repr__(self):
+        return "<JaggedArray %i rows, %i values>" % (len(self), len(self.content))
+
+    def __getitem__(self, what):
+        """
+        jagged[i]              => row i
+        jagged[jagged_mask]    => the values where jagged_mask is true
+        jagged[row_mask]       => the rows where row_mask (one per row) is true
+        """
+        if isinstance(what, JaggedArray):
+            return JaggedArray.from_counts(self.content[what.content], what.sum())
+
+        if isinstance(what, numpy.ndarray) and what.dtype == numpy.bool_:
+            counts = self.counts[what]
+            offsets = numpy.zeros(len(counts) + 1, dtype=numpy.int64)
+            numpy.cumsum(counts, out=offsets[1:])
+            starts = self.offsets[:-1][what]
+            index = (numpy.arange(offsets[-1]) +
+                     numpy.repeat(starts - offsets[:-1], counts))
+            return JaggedArray(self.content[index], offsets)
+
+        return self.content[self.offsets[what]:self.offsets[what+1]]
+
+    def _operand(self, other):
+        if isinstance(other, JaggedArray):
+            return other.content
+        if isinstance(other, numpy.ndarray) and other.shape == (len(self),):
+            return numpy.repeat(other, self.counts)
+        return other
+
+    def __array__(self, dtype=None):
+        if dtype is None:
+            return self.content
+        return self.content.astype(dtype)
+
+    def __array_wrap__(self, result, context=None, *args):
+        return JaggedArray(result, self.offsets)
+
+    def sum(self):
+        """
+        The sum of each row (the number of true values for a mask)
+        """
+        content = self.content
+        if content.dtype == numpy.bool_:
+            content = content.astype(numpy.int64)
+        result = numpy.zeros(len(self), dtype=content.dtype)
+        nonempty = self.counts > 0
+        if len(content):
+            starts = self.offsets[:-1][nonempty]
+            result[nonempty] = numpy.add.reduceat(content, starts)
+        return result
+
+    def any(self):
+        return self.sum() > 0
+
+def _binary(op):
+    def method(self, other):
+        return JaggedArray(op(self.content, self._operand(other)), self.offsets)
+    return method
+
+def _reflected(op):
+    def method(self, other):
+        return JaggedArray(op(self._operand(other), self.content), self.offsets)
+    return method
+
+def _unary(op):
+    def method(self):
+        return JaggedArray(op(self.content), self.offsets)
+    return method
+
+for _name in ("add", "sub", "mul", "div", "truediv", "pow", "and", "or"):
+    _op = getattr(operator, _name + "_" if _name in ("and", "or") else _name)
+    setattr(JaggedArray, "__%s__" % _name, _binary(_op))
+    setattr(JaggedArray, "__r%s__" % _name, _reflected(_op))
+
+for _name in ("lt", "le", "gt", "ge", "eq", "ne"):
+    setattr(JaggedArray, "__%s__" % _name, _binary(getattr(operator, _name)))
+
+for _name in ("neg", "abs", "invert"):
+    setattr(JaggedArray, "__%s__" % _name, _unary(getattr(operator, _name)))
+
+def column_dtype(typename):
+    """
+    numpy type for a branch type such as "Int_t" or "vector<float>"
+    """
+    typename = typename.lower()
+    if "bool" in typename:
+        return numpy.bool_
+    if "int" in typename or "long" in typename or "short" in typename:
+        return numpy.int64
+    return numpy.float64
+
+def draw_values(tree, expression, lo, n, estimate):
+    """
+    Evaluate `expression` for entries [lo, lo+n) in C++ and return the
+    values as an array.
+    """
+    tree.SetEstimate(estimate + 1)
+    rows = tree.Draw(expression, "", "goff", n, lo)
+    if rows < 0:
+        raise RuntimeError("Couldn't evaluate '%s'" % expression)
+    if not rows:
+        return numpy.zeros(0)
+    values = tree.GetV1()
+    values.SetSize(rows)
+    return numpy.frombuffer(values, dtype=numpy.float64, count=rows).copy()
+
+def nest(layout):
+    """
+    Turn [(path, branch, type)] into nested {name: branch or {...}}
+    """
+    result = {}
+    for path, branch, typename in layout:
+        d = result
+        for name in path[:-1]:
+            d = d.setdefault(name, {})
+        d[path[-1]] = branch
+    return result
+
+class ColumnLayout(object):
+    """
+    The branches of `tree` for Global and each of the wrapped collections,
+    resolved once and shared by every chunk.
+    """
+    def __init__(self, tree, options):
+        self.tree = tree
+        self.types = {}
+
+        layouts = [("", Global, None)]
+        layouts.extend((name, cls, None)
+                       for name, cls, _ in collection_classes(tree, options))
+
+        self.members = {}
+        for name, cls, rootname in layouts:
+            layout = tree_layout(tree, cls, rootname)
+            self.types.update((branch, typename) for _, branch, typename in layout)
+            members = nest(layout)
+            if name:
+                self.members[name] = members
+            else:
+                self.members.update(members)
+
+class ColumnGroup(object):
+    """
+    Columns for the members of one object. Columns are read on first access.
+    """
+    def __init__(self, chunk, members):
+        self._chunk = chunk
+        self._members = members
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            member = self._members[name]
+        except KeyError:
+            raise AttributeError("No branch for '%s'" % name)
+
+        if isinstance(member, dict):
+            value = ColumnGroup(self._chunk, member)
+        else:
+            value = self._chunk.column(member)
+        # Cache it for the rest of the chunk
+        setattr(self, name, value)
+        return value
+
+class Chunk(ColumnGroup):
+    """
+    Entries [lo, lo+n) of the tree as columns.
+    """
+    def __init__(self, layout, lo, n):
+        super(Chunk, self).__init__(self, layout.members)
+        self._layout = layout
+        self.lo, self.n = lo, n
+
+    def __len__(self):
+        return self.n
+
+    @property
+    def entries(self):
+        return numpy.arange(self.lo, self.lo + self.n)
+
+    def column(self, branch):
+        tree, lo, n = self._layout.tree, self.lo, self.n
+        typename = self._layout.types[branch]
+        dtype = column_dtype(typename)
+
+        if not typename.startswith("vector"):
+            return draw_values(tree, branch, lo, n, n).astype(dtype)
+
+        counts = draw_values(tree, "Length$(%s)" % branch, lo, n, n)
+        counts = counts.astype(numpy.int64)
+        content = draw_values(tree, branch, lo, n, counts.sum())
+        return JaggedArray.from_counts(content.astype(dtype), counts)
+
+def chunk_ranges(chain, lo, hi, chunk_size):
+    """
+    Split [lo, hi) into ranges of at most `chunk_size` entries which don't
+    cross a file boundary.
+    """
+    start = lo
+    while start < hi:
+        chain.LoadTree(start)
+        tree_end = chain.GetChainOffset() + chain.GetTree().GetEntries()
+        end = min(hi, tree_end, start + chunk_size)
+        yield start, end
+        start = end
+
+def loop_chunks(chain, options, function, chunk_size, lo, hi):
+    """
+    Call function(lo, chunk) for successive chunks of [lo, hi).
+    Returns the number of entries processed.
+    """
+    layout = ColumnLayout(chain, options)
+    hi = min(hi, chain.GetEntries())
+    processed = 0
+    for start, end in chunk_ranges(chain, lo, hi, chunk_size):
+        function(start, Chunk(layout, start, end - start))
+        processed += end - start
+    return processed
@@ -21,6 +21,21 @@ def get_name(what):
     elif isinstance(what, FunctionType):
         return what.__name__
 
+def tree_members(cls):
+    """
+    Return the branch members (tree variables) of `cls` as {name: descriptor},
+    combined across the MRO.
+    """
+    final_dict = {}        
+    for base in reversed(cls.mro()):
+        for member, value in sorted(base.__dict__.iteritems()):
+            if isinstance(value, TI._ti_type):  
+                final_dict[member] = value
+            elif member in final_dict:
+                # Hm, the member is overwritten by a non-branch. Forget it.
+                del final_dict[member]
+    return final_dict
+
 class ConditionalMeta(type):
     """
     Types having this as the metaclass can conditionally define functions with
@@ -101,14 +116,7 @@ class ConditionalMeta(type):
                 dct[name] = func
 
         # Figure out what the final branch members are by combining across the MRO
-        final_dict = {}        
-        for base in reversed(target.mro()):
-            for member, value in sorted(base.__dict__.iteritems()):
-                if isinstance(value, TI._ti_type):  
-                    final_dict[member] = value
-                elif member in final_dict:
-                    # Hm, the member is overwritten by a non-branch. Forget it.
-                    del final_dict[member]
+        final_dict = tree_members(target)
         
         # Over-write.
         for member, value in sorted(final_dict.iteritems()):
@@ -7,6 +7,8 @@ from pytuple.treeinfo import treeinfo as TI
 from .base import (CurrentVS, VariableSelection, Global, Trigger, Vertex, 
                    Electron, Photon, TruthPhoton, Jet)
 from .conditional import ConditionalMeta
+from .buffers import bind_buffers
+from .capacity import first_tree_capacities, wrapper_footprint
 
 def setup_pau_trigger_info(t, tt, Trigger, **kwargs):
     
@@ -79,7 +81,33 @@ def setup_pau_trigger_info(t, tt, Trigger, **kwargs):
     
     return TriggerL1, TriggerL2, TriggerEF
 
-def egamma_wrap_tree(t, options):
+def collection_classes(t, options):
+    """
+    The classes which egamma_wrap_tree adds as lists, in the order they are
+    added, as [(name, class, capacity)].
+    """
+    Ph = ConditionalMeta.make_class(Photon, options.project, options.release)
+    El = ConditionalMeta.make_class(Electron, options.project, options.release)
+    
+    if t.GetName() == "physics":
+        # SMWZ: Disable jet matching
+        Ph.imatchRecJet = -1
+    
+    return [
+        ("vertices",     Vertex,      300),
+        ("electrons",    El,          400),
+        ("photons",      Ph,          400),
+        ("jets",         Jet,         400),
+        ("true_photons", TruthPhoton, 400),
+    ]
+
+def egamma_wrap_tree(t, options, capacities=None, binder=None):
+    """
+    Wrap `t`. The collections get `capacities` ({name: capacity}) objects if
+    given, with --adaptive-capacity as many as the first file needs, or
+    otherwise a fixed number. The branches are bound with `binder` if given
+    (when wrapping again, see AnalysisBase.grow_collections).
+    """
     
     leafset = set(l.GetName() for l in t.GetListOfLeaves())
     
@@ -96,19 +124,21 @@ def egamma_wrap_tree(t, options):
             
     tt.add(Global)
     
-    tt.add_list(Vertex,      "vertices",      300, **kwargs)
-        
-    Ph = ConditionalMeta.make_class(Photon, options.project, options.release)
-    El = ConditionalMeta.make_class(Electron, options.project, options.release)
+    collections = collection_classes(t, options)
+    if capacities is None and options.adaptive_capacity:
+        capacities = first_tree_capacities(t, collections)
+    if capacities is not None:
+        collections = [(name, cls, capacities[name]) 
+                       for name, cls, _ in collections]
+    tt.collections = collections
     
-    if t.GetName() == "physics":
-        # SMWZ: Disable jet matching
-        Ph.imatchRecJet = -1
-            
-    tt.add_list(El,          "electrons",     400, **kwargs)
-    tt.add_list(Ph,          "photons",       400, **kwargs)
-    tt.add_list(Jet,         "jets",          400, **kwargs)
-    tt.add_list(TruthPhoton, "true_photons",  400, **kwargs)
+    for name, cls, capacity in collections:
+        tt.add_list(cls, name, capacity, **kwargs)
+    
+    tt.footprint = wrapper_footprint(tt, collections)
+    log.info("Wrapped collections: %s", ", ".join(
+        "%s=%i objects (~%i kB)" % (name, objects, size // 1024)
+        for name, (objects, size) in sorted(tt.footprint.iteritems())))
     
     if selarg.tuple_type == "pau":   
         trigger_classes = setup_pau_trigger_info(t, tt, Trigger, **kwargs)
@@ -123,5 +153,10 @@ def egamma_wrap_tree(t, options):
     if selarg.tuple_type == "pau":
         # larError not defined for PAU.
         tt.larError = 0
+    
+    tt.branch_binder = None
+    if options.bind_buffers or options.lazy_read or options.branch_profile:
+        tt.branch_binder = bind_buffers(tt, t, Global, collections, 
+                                        lazy=options.lazy_read, binder=binder)
         
     return tt
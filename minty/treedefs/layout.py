@@ -0,0 +1,86 @@
+"""
+Resolve the ROOT branch names behind the tree variables of a treedefs class.
+
+This follows the same conventions as the wrapper (see treedefs.base): a
+variable `x` of a class with rootname "ph" lives in "ph_x" unless a naming(...)
+rule says otherwise, and TI.instance members nest, passing their own resolved
+name down as the rootname of their members.
+
+The result is a list of (path, branch) pairs, where path is the tuple of
+attribute names leading to the variable. For example, on an "eg" tuple:
+    (("etas2",), "ph_etas2")
+    (("cl", "E"), "ph_cl_E")
+and on a "pau" tuple:
+    (("etas2",), "ph_etaS2")
+    (("cl", "E"), "ph_E_clus")
+"""
+
+from .base import naming
+from .conditional import tree_members
+
+def descriptor_parts(descriptor):
+    """
+    Return (naming rule, instance class) for a tree descriptor. Either may be
+    None: no naming rule means the default one, no class means a leaf.
+    """
+    namer = instance_class = None
+    values = list(getattr(descriptor, "__dict__", {}).values())
+    for value in values:
+        if isinstance(value, (tuple, list)):
+            values.extend(value)
+        elif getattr(value, "is_naming", False):
+            namer = value
+        elif isinstance(value, type) and tree_members(value):
+            instance_class = value
+    return namer, instance_class
+
+def class_rootname(cls):
+    rootname = getattr(cls, "__rootname__", "")
+    if callable(rootname):
+        rootname = rootname()
+    return rootname
+
+def resolve_branches(cls, rootname=None):
+    """
+    Return [(path, branch)] for all tree variables of `cls` (recursing into
+    instances). Uses the class's __rootname__ unless `rootname` is given.
+    Must be called after the tuple type has been set in CurrentVS.
+    """
+    if rootname is None:
+        rootname = class_rootname(cls)
+
+    result = []
+    for member, descriptor in sorted(tree_members(cls).iteritems()):
+        namer, instance_class = descriptor_parts(descriptor)
+        name = (namer or naming())(rootname, member)
+        if instance_class:
+            result.extend(((member,) + path, branch)
+                          for path, branch in resolve_branches(instance_class, name))
+        else:
+            result.append(((member,), name))
+    return result
+
+def branch_type(tree, name):
+    """
+    The type of branch `name` (e.g. "Int_t", "vector<float>") or None if the
+    tree doesn't have it.
+    """
+    branch = tree.GetBranch(name)
+    if not branch:
+        return None
+    class_name = branch.GetClassName()
+    if class_name:
+        return class_name
+    return branch.GetListOfLeaves()[0].GetTypeName()
+
+def tree_layout(tree, cls, rootname=None):
+    """
+    Like resolve_branches, but only the branches `tree` actually has, as
+    [(path, branch, type)].
+    """
+    result = []
+    for path, branch in resolve_branches(cls, rootname):
+        typename = branch_type(tree, branch)
+        if typename:
+            result.append((path, branch, typename))
+    return result
@@ -0,0 +1,48 @@
+"""
+A record of which branches an analysis actually reads (a "branch profile").
+
+The profile is kept in a sidecar file per analysis class and tuple type, one
+branch name per line. It is recorded by watching the getters installed by
+treedefs.buffers, and used on later runs to switch off every bound branch
+outside of it (see BufferBinder.prune).
+"""
+
+from __future__ import with_statement
+
+from fcntl import flock, LOCK_EX
+from os import getpid, rename
+from os.path import exists, join
+
+def profile_filename(directory, analysis_class, tuple_type):
+    """
+    e.g. ("profiles", MyAnalysis, "eg") => profiles/mymodule.MyAnalysis.eg.branches
+    """
+    name = "%s.%s.%s.branches" % (analysis_class.__module__,
+                                  analysis_class.__name__, tuple_type)
+    return join(directory, name)
+
+def load_profile(filename):
+    """
+    The set of branch names in the profile `filename`
+    """
+    with open(filename) as fd:
+        lines = (line.strip() for line in fd)
+        return set(line for line in lines if line and not line.startswith("#"))
+
+def save_profile(filename, branches):
+    """
+    Add `branches` to the profile `filename`, creating it if needed.
+    
+    Several workers may do this at once: they take turns through a lock file,
+    each adds its branches to what is already there, and the profile is 
+    replaced atomically.
+    """
+    with open("%s.lock" % filename, "w") as lock:
+        flock(lock, LOCK_EX)
+        if exists(filename):
+            branches = load_profile(filename) | set(branches)
+        temporary = "%s.%i.tmp" % (filename, getpid())
+        with open(temporary, "w") as fd:
+            fd.write("# Branches read by the analysis, one per line\n")
+            fd.writelines("%s\n" % branch for branch in sorted(branches))
+        rename(temporary, filename)
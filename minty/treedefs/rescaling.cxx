@@ -0,0 +1,23 @@
+#include "EnergyRescaler.h"
+
+#include <string>
+
+// In the order of rescaling.PART_TYPES
+static const std::string PART_TYPES[] = {
+    "ELECTRON", "UNCONVERTED_PHOTON", "CONVERTED_PHOTON"
+};
+
+// Apply the v16 energy correction (systematic variation `value`) to `n` 
+// objects, given by their cluster eta, phi, energy and et and the index of 
+// their part type.
+void v16_energy_correction_batch(EnergyRescaler& rescaler, int n,
+                                 const double* eta, const double* phi,
+                                 const double* energy, const double* et,
+                                 const int* part_type, int value,
+                                 double* corrected)
+{
+    for (int i = 0; i < n; ++i) {
+        corrected[i] = rescaler.applyEnergyCorrection(
+            eta[i], phi[i], energy[i], et[i], value, PART_TYPES[part_type[i]]);
+    }
+}
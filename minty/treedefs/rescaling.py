@@ -0,0 +1,177 @@
+"""
+The v16 energy correction (EnergyRescaler) for many photons and electrons at 
+once.
+
+EGamma.v16_E_corrected costs a call into C++ for each object. Here the cluster
+kinematics of all the objects of an event (or of a columnar chunk) go to 
+rescaling.cxx in one call, which returns their corrected energies.
+
+If the helper can't be compiled (e.g. EnergyRescaler.h can't be found), the
+objects are corrected one at a time instead, see v16_energy_correction.
+"""
+
+from array import array
+from itertools import izip
+from math import cosh
+
+from pytuple.Fourvec import Fourvec_PtEtaPhiE
+
+from ..utils import deferred_root_loader, memoize, OptionalMacro
+
+# In the order of PART_TYPES in rescaling.cxx
+PART_TYPES = ("ELECTRON", "UNCONVERTED_PHOTON", "CONVERTED_PHOTON")
+PART_CODES = dict((name, i) for i, name in enumerate(PART_TYPES))
+
+c_v16_energy_correction_batch = deferred_root_loader(
+    "rescaling.cxx+", "v16_energy_correction_batch")
+
+batch_helper = OptionalMacro(c_v16_energy_correction_batch,
+                             "EnergyRescalerTool",
+                             "batched v16 energy correction")
+
+@memoize()
+def v16_energy_correction(rescaler, *args):
+    return rescaler.applyEnergyCorrection(*args)
+
+def rescaler_instance(rescaler):
+    """
+    The EnergyRescaler behind `rescaler`, which may be a DeferredInstance (see
+    utils.make_deferred_instance) that hasn't been used yet
+    """
+    if not hasattr(rescaler, "instantiate"):
+        return rescaler
+    if rescaler.instance is None:
+        rescaler.instantiate()
+    return rescaler.instance
+
+def load_batch(rescaler):
+    """
+    Compile and load rescaling.cxx. Returns False if that isn't possible.
+    """
+    empty = array("d", [0.])
+    return batch_helper.load(lambda batch: batch(rescaler_instance(rescaler),
+        0, empty, empty, empty, empty, array("i", [0]), 0, empty))
+
+def v16_corrected_energies(rescaler, eta, phi, energy, et, part_types, n=0):
+    """
+    The v16 corrected energies (systematic variation `n`) of the objects with
+    cluster `eta`, `phi`, `energy` and `et`, and `part_types` names from 
+    PART_TYPES, as an array
+    """
+    if not load_batch(rescaler):
+        return array("d", (v16_energy_correction(rescaler, *args + (n, part))
+            for args, part in izip(izip(eta, phi, energy, et), part_types)))
+    
+    count = len(eta)
+    corrected = array("d", [0.]) * count
+    if count:
+        codes = array("i", (PART_CODES[part] for part in part_types))
+        c_v16_energy_correction_batch(rescaler_instance(rescaler), count,
+            array("d", eta), array("d", phi), array("d", energy), 
+            array("d", et), codes, n, corrected)
+    return corrected
+
+def v16_object_energies(rescaler, objects, n=0):
+    """
+    The v16 corrected energies of EGamma `objects`, see EGamma.v16_E_corrected
+    """
+    clusters = [o.cl for o in objects]
+    etas2 = [o.etas2 for o in objects]
+    energy = [cl.E for cl in clusters]
+    et = [E / cosh(eta) for E, eta in izip(energy, etas2)]
+    return v16_corrected_energies(rescaler, etas2, [cl.phi for cl in clusters],
+        energy, et, [o._part_type for o in objects], n)
+
+class FourvecArray(object):
+    """
+    Four-vectors stored as the sequences `pt`, `eta`, `phi` and `E`, plus any
+    other per-object sequences given as keyword arguments (e.g. isConv).
+    
+    Indexing (or iterating) makes a Fourvec_PtEtaPhiE with the other 
+    attributes set, as EGamma.v16_corrections would return.
+    """
+    def __init__(self, pt, eta, phi, E, **extra):
+        self.pt, self.eta, self.phi, self.E = pt, eta, phi, E
+        self.extra = extra
+        for name, values in extra.iteritems():
+            setattr(self, name, values)
+    
+    def __len__(self):
+        return len(self.pt)
+    
+    def __getitem__(self, i):
+        v = Fourvec_PtEtaPhiE(self.pt[i], self.eta[i], self.phi[i], self.E[i])
+        for name, values in self.extra.iteritems():
+            setattr(v, name, values[i])
+        return v
+    
+    def __iter__(self):
+        for i in xrange(len(self)):
+            yield self[i]
+
+def v16_fourvecs(objects, energies):
+    """
+    A FourvecArray of EGamma `objects` with the corrected `energies`
+    """
+    if objects and objects[0].particle == "photon":
+        is_conv = [o.isConv for o in objects]
+    else:
+        # Electrons don't have isConv
+        is_conv = [0] * len(objects)
+    return FourvecArray(array("d", [o.cl.pt for o in objects]),
+                        array("d", [o.etas1 for o in objects]),
+                        array("d", [o.phi for o in objects]),
+                        energies,
+                        isConv=is_conv)
+
+def chunk_v16_energies(rescaler, objects, particle, n=0):
+    """
+    The v16 corrected energies of the photons or electrons (`particle`) of a 
+    columnar chunk (see treedefs.columnar), as a JaggedArray with the rows of
+    `objects`
+    """
+    import numpy
+    from .columnar import JaggedArray
+    
+    etas2 = objects.etas2
+    eta = etas2.content
+    phi, energy = objects.cl.phi.content, objects.cl.E.content
+    et = energy / numpy.cosh(eta)
+    if particle == "photon":
+        codes = numpy.where(objects.isConv.content, 
+                            PART_CODES["CONVERTED_PHOTON"],
+                            PART_CODES["UNCONVERTED_PHOTON"])
+    else:
+        codes = numpy.zeros(len(eta), dtype=numpy.int32)
+    
+    count = len(eta)
+    if load_batch(rescaler):
+        columns = [numpy.ascontiguousarray(c, dtype=numpy.float64) 
+                   for c in (eta, phi, energy, et)]
+        corrected = numpy.zeros(count, dtype=numpy.float64)
+        if count:
+            c_v16_energy_correction_batch(rescaler_instance(rescaler), count,
+                *columns + [codes.astype(numpy.int32), n, corrected])
+    else:
+        corrected = numpy.array(v16_corrected_energies(rescaler, 
+            eta.tolist(), phi.tolist(), energy.tolist(), et.tolist(),
+            [PART_TYPES[c] for c in codes.tolist()], n), dtype=numpy.float64)
+    
+    return JaggedArray(corrected, etas2.offsets)
+
+def chunk_v16_corrections(rescaler, objects, particle, n=0):
+    """
+    A FourvecArray of JaggedArrays for the v16 corrected photons or electrons
+    of a columnar chunk
+    """
+    import numpy
+    from .columnar import JaggedArray
+    
+    energies = chunk_v16_energies(rescaler, objects, particle, n)
+    if particle == "photon":
+        is_conv = objects.isConv
+    else:
+        is_conv = JaggedArray(numpy.zeros(len(energies.content), 
+                                          dtype=numpy.int32), energies.offsets)
+    return FourvecArray(objects.cl.pt, objects.etas1, objects.phi, energies,
+                        isConv=is_conv)
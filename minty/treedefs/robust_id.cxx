@@ -0,0 +1,21 @@
+#include "PhotonIDTool.h"
+
+// Number of shower shape values per photon, in the order of the 
+// PhotonIDTool constructor (see robust_id.SHOWER_SHAPES)
+const int N_SHOWER_SHAPES = 16;
+
+// Evaluate the robust loose, tight and isEM of `n` photons, whose shower 
+// shapes are consecutive in `shapes`.
+void robust_id_batch(int n, const double* shapes, 
+                     int* loose, int* tight, unsigned int* isem)
+{
+    for (int i = 0; i < n; ++i) {
+        const double* s = shapes + i * N_SHOWER_SHAPES;
+        PhotonIDTool tool(s[0], s[1], s[2], s[3], s[4], s[5], s[6], s[7],
+                          s[8], s[9], s[10], s[11], s[12], s[13], s[14],
+                          int(s[15]));
+        loose[i] = tool.PhotonCutsLoose2();
+        tight[i] = tool.PhotonCutsTight(3);
+        isem[i] = tool.isEM(3);
+    }
+}
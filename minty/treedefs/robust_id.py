@@ -0,0 +1,100 @@
+"""
+The robust photon ID (PhotonIDTool) for many photons at once.
+
+Building a PhotonIDTool from python and asking it three questions costs four
+calls into C++ for each photon. Here the shower shapes of all the photons of
+an event (or of a columnar chunk) go to robust_id.cxx in one call, which 
+returns the loose, tight and isEM decisions of each.
+
+If the helper can't be compiled (e.g. PhotonIDTool.h can't be found), the
+photons are evaluated one at a time instead, see robust_id_decisions.
+"""
+
+from array import array
+from itertools import chain
+
+from ..utils import (deferred_import, deferred_root_loader, memoize,
+                     OptionalMacro)
+
+PhotonIDTool = deferred_import("PhotonIDTool", "PhotonIDTool")
+
+# In the order of the PhotonIDTool constructor
+SHOWER_SHAPES = (
+    "et", "etas2",
+    "Ethad1", "Ethad",
+    "E277", "E237", "E233",
+    "weta2",
+    "f1",
+    "emaxs1", "Emax2", "Emins1",
+    "fside",
+    "wstot", "ws3",
+    "isConv",
+)
+
+c_robust_id_batch = deferred_root_loader("robust_id.cxx+", "robust_id_batch")
+
+batch_helper = OptionalMacro(c_robust_id_batch, "PhotonIDTool",
+                             "batched robust ID")
+
+@memoize()
+def robust_id_decisions(*shower_shapes):
+    """
+    (loose, tight, isEM) from the PhotonIDTool for `shower_shapes`
+    """
+    tool = PhotonIDTool(*shower_shapes)
+    return tool.PhotonCutsLoose2(), tool.PhotonCutsTight(3), tool.isEM(3)
+
+def load_batch():
+    """
+    Compile and load robust_id.cxx. Returns False if that isn't possible.
+    """
+    return batch_helper.load(lambda batch: batch(
+        0, array("d", [0.]), array("i", [0]), array("i", [0]), array("I", [0])))
+
+def robust_id_batch(shower_shapes):
+    """
+    [(loose, tight, isEM)] for each of `shower_shapes`, a sequence of tuples
+    in the order of SHOWER_SHAPES
+    """
+    if not load_batch():
+        return [robust_id_decisions(*shapes) for shapes in shower_shapes]
+    
+    n = len(shower_shapes)
+    flat = array("d", chain.from_iterable(shower_shapes))
+    loose, tight = array("i", [0]) * n, array("i", [0]) * n
+    isem = array("I", [0]) * n
+    if n:
+        c_robust_id_batch(n, flat, loose, tight, isem)
+    return [(bool(l), bool(t), int(i)) for l, t, i in zip(loose, tight, isem)]
+
+def chunk_robust_id(photons):
+    """
+    Robust (loose, tight, isEM) of the photons of a columnar chunk (see 
+    treedefs.columnar), as JaggedArrays with the rows of `photons`
+    """
+    import numpy
+    from .columnar import JaggedArray
+    
+    etas2 = photons.etas2
+    columns = [photons.cl.E.content / numpy.cosh(etas2.content)]
+    columns.extend(getattr(photons, name).content for name in SHOWER_SHAPES[1:])
+    flat = numpy.ascontiguousarray(numpy.column_stack(columns), 
+                                   dtype=numpy.float64)
+    n = len(flat)
+    
+    if load_batch():
+        loose = numpy.zeros(n, dtype=numpy.int32)
+        tight = numpy.zeros(n, dtype=numpy.int32)
+        isem = numpy.zeros(n, dtype=numpy.uint32)
+        if n:
+            c_robust_id_batch(n, flat, loose, tight, isem)
+    else:
+        decisions = [robust_id_decisions(*(row[:-1] + [int(row[-1])]))
+                     for row in flat.tolist()]
+        decisions = numpy.array(decisions, dtype=numpy.int64).reshape(n, 3)
+        loose, tight, isem = decisions.T
+    
+    offsets = etas2.offsets
+    return (JaggedArray(loose.astype(bool), offsets), 
+            JaggedArray(tight.astype(bool), offsets),
+            JaggedArray(isem.astype(numpy.uint32), offsets))
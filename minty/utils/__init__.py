@@ -7,10 +7,12 @@ from time import time
 
 from logging import getLogger
 
-from .event_cache import event_cache
+from .event_cache import event_cache, memoize, memoization_stats
 from .cut_graph import CutGroup, Cut, Histo, SetContainer
-from .deferred_load import deferred_root_loader, make_deferred_instance
-from .delta_r import delta_r
+from .deferred_load import (deferred_root_loader, deferred_import,
+                            make_deferred_instance, add_module_include_path,
+                            OptionalMacro)
+from .delta_r import delta_r, delta_r_matrix, overlap_removal
 
 time_logger = getLogger("minty.utils.timer")
 @contextmanager
@@ -41,15 +43,17 @@ def canvas(*args):
         if old_canvas and getattr(old_canvas, "cd", None):
             old_canvas.cd()
 
-def init_root():
+def init_root(quiet=False):
     """
-    Make ROOT init happen without it having argv, so it doesn't catch --help
-    Also stop stupid duplicate warnings.
+    Make ROOT init happen without it looking at argv, so it doesn't catch 
+    --help. With `quiet`, also stop stupid duplicate warnings (this needs a 
+    thread reading the output through a FIFO while ROOT starts up).
     """
-    from .silence import silence_sout_serr
-    import sys
-    with silence_sout_serr(lambda s: "duplicate entry" in s or "Bool" in s):
-        oldargv = sys.argv; sys.argv = []; R.kTRUE; sys.argv = oldargv
+    R.PyConfig.IgnoreCommandLineOptions = True
+    if quiet:
+        from .silence import silence_sout_serr
+        with silence_sout_serr(lambda s: "duplicate entry" in s or "Bool" in s):
+            R.kTRUE
     
     # Help ROOT's memory management
     creating_functions = [
@@ -101,8 +105,11 @@ wait = wait_for_zero_canvases
 def prevent_close_with_canvases():
     register(wait_for_zero_canvases)
 
-def make_chain(files):
-    first_file = R.TFile.Open(files[0])
+def find_tree_name(filename):
+    """
+    The name of the tree to analyse in `filename`
+    """
+    first_file = R.TFile.Open(filename)
     available_keys = set(k.GetName() for k in first_file.GetListOfKeys())
     if "PAUReco" in available_keys:
         treename = "PAUReco"
@@ -112,10 +119,33 @@ def make_chain(files):
     	treename = "photon"
     else:
         treename = "egamma"
-    c = R.TChain(treename)
+    return treename
+
+def make_chain(files, cache_size=0, cache_learn_entries=0):
+    c = R.TChain(find_tree_name(files[0]))
     for f in files:
         c.AddFile(f)
+    if cache_size:
+        # The chain gives each of its trees a TTreeCache of this size
+        c.SetCacheSize(cache_size)
+        if cache_learn_entries:
+            c.SetCacheLearnEntries(cache_learn_entries)
     return c
+
+def configure_cache(chain, branches, learn_entries=0):
+    """
+    Restrict the TTreeCache of the current tree of `chain` to those of
+    `branches` which are enabled. Needs doing each time the chain moves on to
+    a new tree. If `learn_entries` is set, the cache finds the branches in 
+    use by itself, which is also limited to the enabled ones.
+    """
+    if learn_entries or not chain.GetCacheSize():
+        return
+    tree = chain.GetTree()
+    for branch in branches:
+        if tree.GetBranch(branch) and tree.GetBranchStatus(branch):
+            chain.AddBranchToCache(branch, True)
+    chain.StopCacheLearningPhase()
     
 def event_loop(function, tree, *args, **kwargs):
     from time import time
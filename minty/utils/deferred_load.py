@@ -1,11 +1,15 @@
+from __future__ import with_statement
+
 
 from commands import getstatusoutput
 from os import environ, listdir
-from os.path import isdir
+from os.path import dirname, isdir
 from pkg_resources import resource_filename, get_provider
 
 from inspect import stack, getmodule
 
+from logging import getLogger; log = getLogger("minty.utils.deferred_load")
+
 import ROOT as R
 
 def get_caller_module():
@@ -93,6 +97,43 @@ def deferred_root_loader(cpp_code, symbol):
     
     return DeferredLoader()
     
+def add_module_include_path(module_name):
+    """
+    Import `module_name`, which loads its library, and add its directory to
+    the include path, for macros compiled against the headers it ships.
+    """
+    module = __import__(module_name)
+    R.gSystem.AddIncludePath("-I%s" % dirname(module.__file__))
+
+class OptionalMacro(object):
+    """
+    A macro (loaded with deferred_root_loader) which is compiled against the
+    headers shipped with `module_name`, and which callers can do without:
+    `available` is None until `load` is first called, then whether the macro
+    could be loaded. `description` names it in the warning if it couldn't.
+    """
+    def __init__(self, function, module_name, description):
+        self.function = function
+        self.module_name = module_name
+        self.description = description
+        self.available = None
+    
+    def load(self, probe):
+        """
+        Compile and load the macro, and check it with probe(function).
+        Returns False if that isn't possible.
+        """
+        if self.available is None:
+            try:
+                add_module_include_path(self.module_name)
+                probe(self.function)
+                self.available = True
+            except (ImportError, RuntimeError, AttributeError, TypeError), e:
+                log.warning("Can't load the %s (%s), falling back to python",
+                            self.description, e)
+                self.available = False
+        return self.available
+    
 def make_deferred_instance(cls, initialization=None):
     """
     Load an instance when one of its methods is first called.
@@ -169,3 +210,28 @@ def make_deferred_instance(cls, initialization=None):
             return getattr(self.instance, what)
         
     return DeferredInstance()
+
+def deferred_import(module_name, symbol):
+    """
+    Import `symbol` from `module_name` when it is first called, so that the
+    cost of importing (and initializing) big modules is only paid if they are
+    used.
+    """
+    class DeferredImport(object):
+        def __call__(self, *args, **kwargs):
+            from .startup import startup_profile
+            with startup_profile.phase("import %s" % module_name):
+                module = __import__(module_name, fromlist=[symbol])
+            actual_symbol = getattr(module, symbol)
+            
+            class DeferredImport_loaded(object):
+                __call__ = staticmethod(actual_symbol)
+            
+            DeferredImport_loaded.__name__ = symbol
+            self.__class__ = DeferredImport_loaded
+            
+            # Not a recursive call because we just replaced ourselves!
+            return self.__call__(*args, **kwargs)
+    
+    DeferredImport.__name__ = symbol
+    return DeferredImport()
@@ -10,3 +10,47 @@ def delta_r(o1, o2):
     if d_phi < -pi: d_phi += pix2
     if d_phi >  pi: d_phi -= pix2
     return hypot(o1.eta - o2.eta, d_phi)
+
+def eta_phi(objects, coordinates=None):
+    """
+    Arrays of the eta and phi of `objects`, taken from their .eta and .phi 
+    or from coordinates(object) => (eta, phi)
+    """
+    import numpy
+    if coordinates is None:
+        values = [(o.eta, o.phi) for o in objects]
+    else:
+        values = [coordinates(o) for o in objects]
+    values = numpy.array(values, dtype=float).reshape(len(values), 2)
+    return values[:, 0], values[:, 1]
+
+def delta_r_matrix(eta1, phi1, eta2, phi2):
+    """
+    Delta R between every pair of (eta1, phi1) and (eta2, phi2) points, as
+    a len(eta1) x len(eta2) array
+    """
+    import numpy
+    d_eta = numpy.subtract.outer(eta1, eta2)
+    d_phi = (numpy.subtract.outer(phi1, phi2) + pi) % pix2 - pi
+    return numpy.hypot(d_eta, d_phi)
+
+def overlap_removal(objects, others, delta, coordinates=None):
+    """
+    Returns (kept, matrix): the `objects` which are further than `delta` in
+    Delta R from all of `others`, and the Delta R matrix between them. An
+    object is never compared with itself (the same object, by identity), so
+    `objects` and `others` may overlap or be one collection. See eta_phi for
+    `coordinates`.
+    """
+    import numpy
+    eta1, phi1 = eta_phi(objects, coordinates)
+    eta2, phi2 = eta_phi(others, coordinates)
+    matrix = delta_r_matrix(eta1, phi1, eta2, phi2)
+    if not len(eta2):
+        return list(objects), matrix
+    
+    itself = numpy.equal.outer([id(o) for o in objects], 
+                               [id(o) for o in others])
+    distances = numpy.where(itself, numpy.inf, matrix)
+    keep = distances.min(axis=1) > delta
+    return [o for o, k in zip(objects, keep) if k], matrix
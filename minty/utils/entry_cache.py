@@ -0,0 +1,71 @@
+"""
+Remember which entries survived an analysis run, so that reruns of the same
+selection only need to visit those.
+
+A cache file is a flat array of entry numbers. It is named after a hash of
+everything which decides what is selected: the input files, the analysis,
+the options in SELECTION_OPTIONS, the contents of the GRL, the entry range and
+a version string which the user bumps whenever the selection code changes.
+"""
+
+from __future__ import with_statement
+
+from array import array
+from hashlib import sha1
+from os import listdir, rename
+from os.path import isfile, join
+
+from logging import getLogger; log = getLogger("minty.utils.entry_cache")
+
+# Options which change the events an analysis keeps
+SELECTION_OPTIONS = ("preselect", "selection_version", "obj_selection", 
+                     "project", "release")
+
+def grl_digest(grl_path):
+    """
+    A hash of the good run list(s) at `grl_path` (a file, or a directory of
+    .xml files as GRL reads them), or "" without one
+    """
+    if not grl_path:
+        return ""
+    filenames = [grl_path]
+    if not isfile(grl_path):
+        filenames = [join(grl_path, name) for name in sorted(listdir(grl_path))
+                     if name.endswith(".xml")]
+    digest = sha1()
+    for filename in filenames:
+        with open(filename, "rb") as fd:
+            digest.update(fd.read())
+    return digest.hexdigest()
+
+def entry_cache_key(files, analysis_class, options, lo, hi):
+    key = sha1()
+    selection = ["%s=%s" % (name, getattr(options, name) or "") 
+                 for name in SELECTION_OPTIONS]
+    for part in list(files) + [analysis_class.__module__,
+                               analysis_class.__name__,
+                               grl_digest(options.grl_path), 
+                               str(lo), str(hi)] + selection:
+        key.update(part)
+        key.update("\0")
+    return key.hexdigest()
+
+def entry_cache_filename(directory, key):
+    return join(directory, "%s.entries" % key)
+
+def load_entries(filename):
+    entries = array("l")
+    with open(filename, "rb") as fd:
+        data = fd.read()
+    entries.fromstring(data)
+    return entries
+
+def save_entries(filename, entries):
+    """
+    Write `entries` to `filename`, atomically
+    """
+    temporary = "%s.tmp" % filename
+    with open(temporary, "wb") as fd:
+        array("l", entries).tofile(fd)
+    rename(temporary, filename)
+    log.info("Saved %i entries to %s", len(entries), filename)
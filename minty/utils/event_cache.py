@@ -1,4 +1,7 @@
+from collections import OrderedDict
 from functools import wraps
+from sys import _getframe
+from time import time
 
 def func_namespace(func):
     """Generates a unique namespace for a function"""
@@ -11,15 +14,58 @@ def func_namespace(func):
         return '%s.%s' % (kls.__module__, kls.__name__)
     else:
         return '%s.%s' % (func.__module__, func.__name__)
+
+def method_namespace(func, frame):
+    """
+    The namespace of a method which is being decorated in a class body, 
+    `frame`: "module.Class.method", so that methods of the same name in 
+    different classes don't share one.
+    """
+    if "__module__" not in frame.f_locals:
+        return func_namespace(func)
+    return '%s.%s.%s' % (func.__module__, frame.f_code.co_name, func.__name__)
                                                               
 class EventCache(object):
+    """
+    Caches values for the duration of an event. Values cached with __call__
+    are kept in a dict keyed on the arguments, those cached with per_instance
+    on the instance itself, tagged with the generation (the number of calls
+    to invalidate) in which they were computed.
+    
+    With enable_stats, hits, misses and the time spent computing values are
+    counted for each cached function. That works by swapping in counting 
+    versions of get_value, invalidate and the per_instance wrappers, so the
+    counters cost nothing unless they are enabled.
+    """
     def __init__(self):
         self.store = {}
+        self.generation = 0
+        
+        # The per_instance wrappers, and the namespace of each function
+        self.wrappers = []
+        self.namespaces = {}
+        
+        # {function or namespace: [hits, misses, time]}, None if disabled
+        self.stats = None
+        self.events = 0
 
     def get_value(self, key, createfunc):
         if not key in self.store:
             self.store[key] = createfunc()
         return self.store[key]
+    
+    def counting_get_value(self, key, createfunc):
+        stats = self.stats.get(key[0])
+        if stats is None:
+            stats = self.stats[key[0]] = [0, 0, 0.]
+        if key in self.store:
+            stats[0] += 1
+            return self.store[key]
+        start = time()
+        value = self.store[key] = createfunc()
+        stats[1] += 1
+        stats[2] += time() - start
+        return value
         
     def __call__(self, func):
         namespace = (func_namespace(func),)
@@ -29,7 +75,152 @@ class EventCache(object):
             return self.get_value(key, createfunc=lambda: func(*args))
         return trampoline
         
+    def per_instance(self, func):
+        """
+        Cache a method which only takes `self` in an attribute of the 
+        instance, so that neither a lookup nor invalidating needs any 
+        hashing.
+        """
+        attribute = "_event_cache_%s" % func.__name__
+        cache = self
+        @wraps(func)
+        def cached(instance):
+            stored = instance.__dict__.get(attribute)
+            if stored is not None and stored[0] == cache.generation:
+                return stored[1]
+            value = func(instance)
+            instance.__dict__[attribute] = cache.generation, value
+            return value
+        
+        # Must use the same free variables as `cached`, see enable_stats
+        def counting(instance):
+            stats = cache.stats[func]
+            stored = instance.__dict__.get(attribute)
+            if stored is not None and stored[0] == cache.generation:
+                stats[0] += 1
+                return stored[1]
+            start = time()
+            value = func(instance)
+            stats[1] += 1
+            stats[2] += time() - start
+            instance.__dict__[attribute] = cache.generation, value
+            return value
+        
+        cached.plain_code = cached.func_code
+        cached.counting_code = counting.func_code
+        self.wrappers.append(cached)
+        self.namespaces[func] = method_namespace(func, _getframe(1))
+        return cached
+        
     def invalidate(self):
-        self.store.clear()
+        self.generation += 1
+        if self.store:
+            self.store.clear()
+    
+    def counting_invalidate(self):
+        self.events += 1
+        EventCache.invalidate(self)
+    
+    def enable_stats(self):
+        """
+        Start counting, see collect_stats
+        """
+        self.stats = dict((func, [0, 0, 0.]) for func in self.namespaces)
+        self.events = 0
+        self.get_value = self.counting_get_value
+        self.invalidate = self.counting_invalidate
+        for wrapper in self.wrappers:
+            wrapper.func_code = wrapper.counting_code
+    
+    def disable_stats(self):
+        self.stats = None
+        del self.get_value, self.invalidate
+        for wrapper in self.wrappers:
+            wrapper.func_code = wrapper.plain_code
+    
+    def collect_stats(self, reset=True):
+        """
+        {namespace: {"hits", "misses", "time", "events"}} for the cached 
+        functions which were used. `time` is spent computing values, and as
+        the cache is emptied for each event, misses / events is the average
+        number of values it held for that function.
+        """
+        result = {}
+        for key, (hits, misses, spent) in self.stats.iteritems():
+            if hits or misses:
+                namespace = self.namespaces.get(key, key)
+                result[namespace] = dict(hits=hits, misses=misses, time=spent,
+                                         events=self.events)
+        if reset:
+            for stats in self.stats.itervalues():
+                stats[:] = [0, 0, 0.]
+            self.events = 0
+        return result
         
 event_cache = EventCache()
+
+# All Memoized functions, for memoization_stats
+memoized = []
+
+class Memoized(object):
+    """
+    A function whose results are remembered across events, for the last
+    `maxsize` distinct arguments. See `memoize`.
+    """
+    def __init__(self, func, maxsize, quantum=None, name=None):
+        self.func = func
+        self.maxsize = maxsize
+        self.quantum = quantum
+        self.name = name or func_namespace(func)
+        self.store = OrderedDict()
+        self.hits = self.misses = 0
+        memoized.append(self)
+    
+    def key(self, args):
+        quantum = self.quantum
+        if quantum is None:
+            return args
+        return tuple(x if q is None else int(round(x / q))
+                     for x, q in zip(args, quantum))
+    
+    def __call__(self, *args):
+        key = self.key(args)
+        store = self.store
+        try:
+            # Move it to the end: the most recently used
+            value = store.pop(key)
+        except KeyError:
+            self.misses += 1
+            value = self.func(*args)
+            if len(store) >= self.maxsize:
+                store.popitem(last=False)
+        else:
+            self.hits += 1
+        store[key] = value
+        return value
+
+def memoize(maxsize=10000, quantum=None, name=None):
+    """
+    Remember the results of a function which only depends on its arguments, 
+    not on the event, in an LRU cache of `maxsize` entries which survives
+    event_cache.invalidate.
+    
+    `quantum` allows arguments which are close enough to share a result: for
+    each argument it is None (compared exactly) or the step it is rounded 
+    to. The result is a callable object rather than a function, so it isn't
+    made into a method when it's used as a class attribute.
+    """
+    def decorate(func):
+        return Memoized(func, maxsize, quantum, name)
+    return decorate
+
+def memoization_stats(reset=True):
+    """
+    {name: (hits, misses, size)} for every memoized function
+    """
+    result = {}
+    for function in memoized:
+        result[function.name] = function.hits, function.misses, len(function.store)
+        if reset:
+            function.hits = function.misses = 0
+    return result
@@ -0,0 +1,109 @@
+"""
+A catalogue of where each event of a dataset is: (run, event) => (file, entry).
+
+The catalogue is one file which is used through mmap, so a lookup only reads
+a few pages of it:
+
+    header    magic, number of records, offset of the text section
+    records   (key, location) pairs of unsigned 64 bit integers, sorted by key
+                key      = run << 32 | event (see event_index.pack)
+                location = file number << 40 | entry in that file
+    text      the tree name, then "<entries> <filename>" for each file
+
+It is built by minty-event-catalogue (see minty.tools.event_catalogue).
+"""
+
+from __future__ import with_statement
+
+from mmap import mmap, ACCESS_READ
+from struct import Struct
+
+from logging import getLogger; log = getLogger("minty.utils.event_catalogue")
+
+from .event_index import pack
+
+MAGIC = "MINTYCAT"
+HEADER = Struct("<8sQQ")
+RECORD = Struct("<QQ")
+FILE_SHIFT = 40
+
+def write_catalogue(filename, tree_name, files, records):
+    """
+    Write a catalogue. `files` is [(entries, filename)] and `records` an
+    iterable of (key, location), in key order.
+    """
+    with open(filename, "wb") as fd:
+        fd.write(HEADER.pack(MAGIC, 0, 0))
+        count = 0
+        for key, location in records:
+            fd.write(RECORD.pack(key, location))
+            count += 1
+        text_offset = fd.tell()
+        fd.write("\n".join([tree_name] + ["%i %s" % f for f in files]))
+        fd.seek(0)
+        fd.write(HEADER.pack(MAGIC, count, text_offset))
+    return count
+
+class EventCatalogue(object):
+    def __init__(self, filename):
+        self.fd = open(filename, "rb")
+        self.map = mmap(self.fd.fileno(), 0, access=ACCESS_READ)
+        magic, self.count, text_offset = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC:
+            raise RuntimeError("%s isn't an event catalogue" % filename)
+
+        lines = self.map[text_offset:].split("\n")
+        self.tree_name = lines[0]
+        self.files = []
+        for line in lines[1:]:
+            entries, name = line.split(" ", 1)
+            self.files.append((int(entries), name))
+
+    def record(self, i):
+        return RECORD.unpack_from(self.map, HEADER.size + i * RECORD.size)
+
+    def find(self, run, event):
+        """
+        Returns (file number, entry) of the event, or None
+        """
+        key = pack(run, event)
+        lo, hi = 0, self.count
+        while lo < hi:
+            middle = (lo + hi) // 2
+            if self.record(middle)[0] < key:
+                lo = middle + 1
+            else:
+                hi = middle
+        if lo == self.count:
+            return None
+        found, location = self.record(lo)
+        if found != key:
+            return None
+        return location >> FILE_SHIFT, location & ((1 << FILE_SHIFT) - 1)
+
+    def select(self, ids):
+        """
+        For the (run, event) pairs in `ids`, returns (files, entries): the
+        files which contain them as [(entries, filename)], and their (sorted)
+        entries in a chain of just those files.
+        """
+        locations = set()
+        for run, event in ids:
+            location = self.find(run, event)
+            if location is None:
+                log.warning("Event (run, event) = %r isn't in the catalogue",
+                            (run, event))
+            else:
+                locations.add(location)
+
+        numbers = sorted(set(number for number, _ in locations))
+        offsets, total = {}, 0
+        for number in numbers:
+            offsets[number] = total
+            total += self.files[number][0]
+
+        files = [self.files[number] for number in numbers]
+        entries = sorted(offsets[number] + entry for number, entry in locations)
+        log.info("%i events are in %i of %i files", len(entries), len(files),
+                 len(self.files))
+        return files, entries
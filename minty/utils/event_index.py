@@ -0,0 +1,99 @@
+"""
+Find the chain entries of events given by (run, event) number.
+
+Each input file gets an index: the keys (run << 32 | event) of its entries in
+sorted order, with the entry of each. Where possible it is saved next to the
+file as "<file>.eventindex" and reused as long as it is newer than the file,
+so a file is only scanned once.
+"""
+
+from __future__ import with_statement
+
+from array import array
+from bisect import bisect_left
+
+from logging import getLogger; log = getLogger("minty.utils.event_index")
+
+import ROOT as R
+
+from .sidecar import sidecar_value
+
+INDEX_SUFFIX = ".eventindex"
+
+def pack(run, event):
+    return ((run & 0xffffffff) << 32) | (event & 0xffffffff)
+
+def build_index(filename, tree_name, run_branch, event_branch):
+    """
+    Returns (keys, entries) for the tree `tree_name` in `filename`
+    """
+    f = R.TFile.Open(filename)
+    if not f or f.IsZombie():
+        raise RuntimeError("Couldn't open %s" % filename)
+    tree = f.Get(tree_name)
+    n = tree.GetEntries()
+    tree.SetEstimate(n + 1)
+    tree.Draw("%s:%s" % (run_branch, event_branch), "", "goff")
+    runs, events = tree.GetV1(), tree.GetV2()
+    pairs = sorted((pack(int(runs[i]), int(events[i])), i) for i in xrange(n))
+    f.Close()
+    return array("L", (k for k, _ in pairs)), array("l", (e for _, e in pairs))
+
+def save_index(filename, keys, entries):
+    with open(filename, "wb") as fd:
+        keys.tofile(fd)
+        entries.tofile(fd)
+
+def load_index(filename):
+    with open(filename, "rb") as fd:
+        data = fd.read()
+    keys, entries = array("L"), array("l")
+    half = len(data) // 2
+    keys.fromstring(data[:half])
+    entries.fromstring(data[half:])
+    return keys, entries
+
+def file_index(filename, tree_name, run_branch, event_branch):
+    """
+    The index of `filename`, from its sidecar if it has a valid one
+    """
+    def build():
+        log.info("Building event index for %s", filename)
+        return build_index(filename, tree_name, run_branch, event_branch)
+    
+    def save(sidecar, index):
+        save_index(sidecar, *index)
+    
+    return sidecar_value(filename, INDEX_SUFFIX, load_index, build, save,
+                         "event index")
+
+def find_entries(chain, ids, run_branch, event_branch):
+    """
+    Returns the sorted chain entries of the (run, event) pairs in `ids`
+    """
+    wanted = sorted(set(pack(run, event) for run, event in ids))
+    found, offset = {}, 0
+    for element in chain.GetListOfFiles():
+        keys, entries = file_index(element.GetTitle(), chain.GetName(),
+                                   run_branch, event_branch)
+        for key in wanted:
+            position = bisect_left(keys, key)
+            if position < len(keys) and keys[position] == key:
+                found.setdefault(key, offset + entries[position])
+        offset += len(keys)
+
+    if len(found) < len(wanted):
+        missing = [(key >> 32, key & 0xffffffff)
+                   for key in wanted if key not in found]
+        log.warning("Couldn't find %i of %i events, e.g. (run, event) = %r",
+                    len(missing), len(wanted), missing[:10])
+    return sorted(found.values())
+
+def make_entry_list(chain, entries):
+    """
+    A TEntryList of the (global) `entries` of `chain`
+    """
+    entry_list = R.TEntryList("minty_entries", "", chain)
+    for entry in entries:
+        entry_list.Enter(entry, chain)
+    return entry_list
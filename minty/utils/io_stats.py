@@ -0,0 +1,45 @@
+"""
+Counters for the I/O done while reading the input, so that it's possible to
+tell whether a job was limited by reading or by decompressing the input, or
+by the analysis itself.
+
+They are only kept with --io-stats: the TTreePerfStats is called for every
+basket read, and adds a point to its graphs each time.
+"""
+
+import ROOT as R
+
+class IOStats(object):
+    """
+    I/O counters for a chain, reported as the difference since the last
+    `collect`. Bytes read and read calls are counted by TFile for the whole
+    process, the time spent reading from disk and decompressing comes from a
+    TTreePerfStats attached to the chain.
+    """
+    def __init__(self, chain):
+        self.perf_stats = R.TTreePerfStats("minty_io_stats", chain)
+        self.reset()
+
+    def totals(self):
+        perf_stats = self.perf_stats
+        return {
+            "io_bytes_read" : R.TFile.GetFileBytesRead(),
+            "io_read_calls" : R.TFile.GetFileReadCalls(),
+            "io_disk_time"  : perf_stats.GetDiskTime(),
+            "io_unzip_time" : perf_stats.GetUnzipTime(),
+        }
+
+    def reset(self):
+        self.previous = self.totals()
+
+    def collect(self, reset=True):
+        """
+        Returns {name: value} for the I/O done since the last call (which
+        doesn't count if it had `reset` false)
+        """
+        totals = self.totals()
+        result = dict((name, value - self.previous[name])
+                      for name, value in totals.iteritems())
+        if reset:
+            self.previous = totals
+        return result
@@ -0,0 +1,109 @@
+"""
+Helpers for running pieces of an analysis in forked worker processes.
+"""
+
+import os
+import sys
+
+from logging import getLogger; log = getLogger("minty.utils.parallel")
+
+def cluster_start(chain, entry):
+    """
+    The first entry of the cluster (set of baskets) of `chain` which 
+    contains `entry`
+    """
+    local = chain.LoadTree(entry)
+    if local < 0:
+        return entry
+    clusters = chain.GetTree().GetClusterIterator(0)
+    while True:
+        start = clusters()
+        if clusters.GetNextEntry() > local:
+            return entry - local + start
+
+def split_clusters(chain, lo, hi, pieces):
+    """
+    Split [lo, hi) into exactly `pieces` contiguous ranges of about equal
+    size, but with the split points moved back to cluster boundaries, so
+    that no cluster has to be read for two ranges. Some ranges may be empty
+    if there are fewer clusters than pieces. Only depends on its arguments,
+    so the same split is found every time.
+    """
+    points = [lo]
+    for i in xrange(1, pieces):
+        point = cluster_start(chain, lo + (hi - lo) * i // pieces)
+        points.append(min(hi, max(point, points[-1])))
+    points.append(hi)
+    return zip(points[:-1], points[1:])
+
+def partial_filename(name, tag):
+    """
+    Name of a partial output, e.g. ("output.root", "job1") => output.job1.root
+    """
+    if name.endswith(".root"):
+        name = name[:-len(".root")]
+    return "%s.%s.root" % (name, tag)
+
+def unused_filename(name):
+    """
+    `name`, or if that exists, the first of name.0, name.1, .. which doesn't
+    """
+    if not os.path.exists(name):
+        return name
+    for i in xrange(300):
+        namepart = "%s.%i" % (name, i)
+        if not os.path.exists(namepart):
+            return namepart
+    
+    raise RuntimeError("Created more files than expected..")
+
+def remove_stale_outputs(outputs):
+    """
+    Remove partial `outputs` left by an earlier run which failed, so that
+    each worker writes exactly the file it is given and nothing stale gets
+    merged.
+    """
+    for output in outputs:
+        if os.path.exists(output):
+            log.warning("Removing %s left by an earlier run", output)
+            os.remove(output)
+
+def fork_worker(function, *args):
+    """
+    Run `function(*args)` in a forked child process and return its pid.
+
+    The child never returns from here: it exits with status 0 if `function`
+    completed and 1 if it raised.
+    """
+    sys.stdout.flush(); sys.stderr.flush()
+    pid = os.fork()
+    if pid:
+        return pid
+
+    status = 1
+    try:
+        function(*args)
+        status = 0
+    except:
+        log.exception("Worker process %i failed", os.getpid())
+    finally:
+        sys.stdout.flush(); sys.stderr.flush()
+        os._exit(status)
+
+def wait_any():
+    """
+    Wait for any worker to exit. Returns (pid, failed).
+    """
+    pid, status = os.wait()
+    return pid, bool(status)
+
+def wait_workers(pids):
+    """
+    Wait for all of `pids` to exit. Returns the list of pids which failed.
+    """
+    failed = []
+    for pid in pids:
+        _, status = os.waitpid(pid, 0)
+        if status:
+            failed.append(pid)
+    return failed
@@ -0,0 +1,114 @@
+"""
+Prefetch the next file of a chain while the current one is processed.
+
+Local files are read into the OS page cache by a background thread: the
+first `max_bytes` (where the first baskets are) and the tail (where the keys
+and streamer info are). Remote files are opened with TFile::AsyncOpen, which
+TFile::Open picks up when the chain gets to them.
+"""
+
+from __future__ import with_statement
+
+from os import fstat
+from threading import Thread
+from time import time
+
+from logging import getLogger; log = getLogger("minty.utils.prefetch")
+
+import ROOT as R
+
+from .sidecar import local_path
+
+BLOCK_SIZE = 1024 * 1024
+TAIL_SIZE = 4 * BLOCK_SIZE
+
+def read_ahead(path, max_bytes):
+    """
+    Read the head and tail of `path`, so that they're in the page cache
+    """
+    with open(path, "rb") as fd:
+        done = 0
+        while done < max_bytes:
+            block = fd.read(min(BLOCK_SIZE, max_bytes - done))
+            if not block:
+                return
+            done += len(block)
+        size = fstat(fd.fileno()).st_size
+        if size > done:
+            fd.seek(max(done, size - TAIL_SIZE))
+            while fd.read(BLOCK_SIZE):
+                pass
+
+class PrefetchJob(object):
+    def __init__(self, filename, max_bytes):
+        self.filename = filename
+        self.start = time()
+        self.finished = None
+        self.handle = None
+
+        path = local_path(filename)
+        if path is None:
+            self.handle = R.TFile.AsyncOpen(filename)
+        else:
+            self.thread = Thread(target=self.run, args=(path, max_bytes))
+            self.thread.setDaemon(True)
+            self.thread.start()
+
+    def run(self, path, max_bytes):
+        try:
+            read_ahead(path, max_bytes)
+        except (IOError, OSError), e:
+            log.warning("Couldn't prefetch %s: %s", path, e)
+            return
+        self.finished = time()
+
+    @property
+    def done(self):
+        if self.handle is not None:
+            return R.TFile.GetAsyncOpenStatus(self.handle) == R.TFile.kAOSSuccess
+        return self.finished is not None
+
+    @property
+    def duration(self):
+        """
+        How long the prefetch took, where that is known
+        """
+        if self.finished is None:
+            return 0.
+        return self.finished - self.start
+
+class FilePrefetcher(object):
+    """
+    Keeps one file in flight. Call `prefetch` with the next file when a new
+    file is started, and `arrived` when the chain opens a file.
+
+    A file which was completely prefetched by the time it was opened counts
+    as a hit, the time spent prefetching it is counted as saved. (The time
+    taken by an asynchronous open isn't known, so it isn't counted.)
+    """
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.job = None
+        self.reset()
+
+    def reset(self):
+        self.hits = self.misses = 0
+        self.saved_time = 0.
+
+    def prefetch(self, filename):
+        if self.job and self.job.filename == filename:
+            return
+        log.debug("Prefetching %s", filename)
+        self.job = PrefetchJob(filename, self.max_bytes)
+
+    def arrived(self, filename):
+        job, self.job = self.job, None
+        if not job or job.filename != filename:
+            # The first file, or files were skipped
+            return
+        if job.done:
+            self.hits += 1
+            self.saved_time += job.duration
+        else:
+            log.debug("Prefetch of %s didn't finish in time", filename)
+            self.misses += 1
@@ -0,0 +1,37 @@
+"""
+Select entries with a TTreeFormula expression, evaluated in C++ by
+TTree::Draw, so that entries which fail never reach python.
+"""
+
+from logging import getLogger; log = getLogger("minty.utils.preselect")
+
+import ROOT as R
+
+def formula_branches(tree, expression):
+    """
+    The names of the branches `expression` reads
+    """
+    formula = R.TTreeFormula("minty_formula", expression, tree)
+    if not formula.GetTree():
+        raise RuntimeError("TTreeFormula didn't compile: " + expression)
+    return set(formula.GetLeaf(i).GetBranch().GetName()
+               for i in xrange(formula.GetNcodes()))
+
+def preselect_entries(tree, expression, lo, hi):
+    """
+    The entries in [lo, hi) of `tree` for which `expression` is true
+    """
+    hi = min(hi, tree.GetEntries())
+    if hi <= lo:
+        return []
+
+    # The event list ends up in the current directory
+    R.gROOT.cd()
+    name = "minty_preselection"
+    if tree.Draw(">>" + name, expression, "goff", hi - lo, lo) < 0:
+        raise RuntimeError("Couldn't evaluate preselection: " + expression)
+    event_list = R.gROOT.Get(name)
+
+    entries = [event_list.GetEntry(i) for i in xrange(event_list.GetN())]
+    log.info("Preselection kept %i of %i entries", len(entries), hi - lo)
+    return entries
@@ -0,0 +1,103 @@
+"""
+Report the progress of the event loop in a small JSON status file, so that
+stuck or slow jobs can be spotted from outside.
+
+The event loop only counts down to the next update. The reporter looks at the
+clock when the countdown runs out, and picks the next countdown from the
+measured rate so that updates happen about every `interval` seconds.
+"""
+
+from __future__ import with_statement
+
+import json
+
+from os import getpid, rename, sysconf
+from socket import gethostname
+from time import time
+
+from logging import getLogger; log = getLogger("minty.utils.progress")
+
+FIRST_COUNTDOWN = 100
+MAX_COUNTDOWN = 1000000
+
+def resident_memory():
+    """
+    Resident set size in bytes, or None if it can't be found
+    """
+    try:
+        with open("/proc/self/statm") as fd:
+            return int(fd.read().split()[1]) * sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError, IndexError):
+        return None
+
+class ProgressReporter(object):
+    """
+    Writes the status of a loop over entries [lo, hi) to `filename`
+    """
+    def __init__(self, filename, interval, lo, hi):
+        self.filename = filename
+        self.interval = interval
+        self.lo, self.hi = lo, hi
+
+        self.start = self.last_update = self.last_write = time()
+        self.events = self.last_events = 0
+        self.rate = 0.
+
+    def update(self, events, entry, current_file, exception_count):
+        """
+        `events` were processed since the last update, the last being `entry`.
+        Returns the number of events to wait until the next update.
+        """
+        now = time()
+        self.events += events
+        if now > self.last_update:
+            self.rate = events / (now - self.last_update)
+        self.last_update = now
+
+        if now - self.last_write >= self.interval:
+            self.write(entry, current_file, exception_count)
+        return self.countdown()
+
+    def countdown(self):
+        """
+        The number of events expected before the next write is due
+        """
+        if not self.rate:
+            return FIRST_COUNTDOWN
+        remaining = self.interval - (time() - self.last_write)
+        return max(1, min(MAX_COUNTDOWN, int(self.rate * remaining)))
+
+    def status(self, entry, current_file, exception_count):
+        elapsed = time() - self.start
+        done = entry + 1 - self.lo
+        eta = None
+        if done > 0:
+            eta = elapsed * (self.hi - self.lo - done) / done
+        return {
+            "host": gethostname(),
+            "pid": getpid(),
+            "time": time(),
+            "elapsed": elapsed,
+            "events": self.events,
+            "entry": entry,
+            "first_entry": self.lo,
+            "last_entry": self.hi - 1,
+            "current_file": current_file,
+            "rate": self.rate,
+            "average_rate": self.events / elapsed if elapsed else 0.,
+            "exception_count": exception_count,
+            "rss": resident_memory(),
+            "eta": eta,
+        }
+
+    def write(self, entry, current_file, exception_count, **extra):
+        status = self.status(entry, current_file, exception_count)
+        status.update(extra)
+        temporary = "%s.tmp" % self.filename
+        try:
+            with open(temporary, "w") as fd:
+                json.dump(status, fd, indent=1, sort_keys=True)
+            rename(temporary, self.filename)
+        except (IOError, OSError), e:
+            log.warning("Couldn't write status file %s: %s", self.filename, e)
+        self.last_write = time()
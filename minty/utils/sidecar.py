@@ -0,0 +1,47 @@
+"""
+Sidecars: small files next to an input file, holding something worked out
+from it (an event index, the multiplicities of its collections) so that it is
+only worked out once. A sidecar is only kept for local files, and is used as
+long as it is newer than the file.
+"""
+
+from __future__ import with_statement
+
+from os import getpid, rename
+from os.path import exists, getmtime
+
+from logging import getLogger; log = getLogger("minty.utils.sidecar")
+
+def local_path(filename):
+    """
+    The path of `filename` if it is a local file, otherwise None
+    """
+    if filename.startswith("file:"):
+        return filename[len("file:"):]
+    if "://" in filename:
+        return None
+    return filename
+
+def sidecar_value(filename, suffix, load, compute, save, what):
+    """
+    load(sidecar) from the sidecar "<filename><suffix>" if there is a valid
+    one and that doesn't return None, otherwise compute(). A computed value
+    is saved with save(temporary, value) and renamed into place, or `what`
+    is named in a warning if that isn't possible.
+    """
+    path = local_path(filename)
+    sidecar = path and path + suffix
+    if sidecar and exists(sidecar) and getmtime(sidecar) >= getmtime(path):
+        value = load(sidecar)
+        if value is not None:
+            return value
+    
+    value = compute()
+    if sidecar:
+        temporary = "%s.%i.tmp" % (sidecar, getpid())
+        try:
+            save(temporary, value)
+            rename(temporary, sidecar)
+        except (IOError, OSError), e:
+            log.warning("Couldn't save %s %s: %s", what, sidecar, e)
+    return value
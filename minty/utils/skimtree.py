@@ -15,3 +15,16 @@ def skimtree(destfile, keepevents, input_tree):
     fout.Write()
     fout.Close()
     return True
+
+def skim_events(destfile, catalogue_file, ids):
+    """
+    Skim the events `ids` ([(run, event)]) into `destfile`, opening only the 
+    files which the event catalogue says contain them.
+    """
+    from .event_catalogue import EventCatalogue
+    catalogue = EventCatalogue(catalogue_file)
+    files, entries = catalogue.select(ids)
+    input_tree = R.TChain(catalogue.tree_name)
+    for file_entries, filename in files:
+        input_tree.AddFile(filename, file_entries)
+    return skimtree(destfile, entries, input_tree)
@@ -0,0 +1,50 @@
+"""
+Where the time goes before the first event: with --profile-startup, the
+import of minty, the setup of the analysis and the first use of the modules
+which are only imported when needed (see deferred_load.deferred_import) are
+timed and written to a JSON file.
+"""
+
+from __future__ import with_statement
+
+import json
+
+from contextlib import contextmanager
+from os import rename
+from time import time
+
+from logging import getLogger; log = getLogger("minty.utils.startup")
+
+class StartupProfile(object):
+    def __init__(self):
+        self.phases = []
+    
+    def record(self, name, start, end):
+        self.phases.append((name, start, end))
+    
+    @contextmanager
+    def phase(self, name):
+        start = time()
+        try:
+            yield
+        finally:
+            self.record(name, start, time())
+    
+    def write(self, filename):
+        import minty
+        origin = minty.IMPORT_STARTED
+        phases = [{"name": name, "start": start - origin, "duration": end - start}
+                  for name, start, end in self.phases]
+        profile = {
+            "import_minty": minty.IMPORT_FINISHED - origin,
+            "phases": phases,
+        }
+        temporary = "%s.tmp" % filename
+        try:
+            with open(temporary, "w") as fd:
+                json.dump(profile, fd, indent=1, sort_keys=True)
+            rename(temporary, filename)
+        except (IOError, OSError), e:
+            log.warning("Couldn't write startup profile %s: %s", filename, e)
+
+startup_profile = StartupProfile()
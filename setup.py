@@ -13,6 +13,7 @@ setup(
             "minty-xs = minty.tools.minty_xsection:main",
             "minty-runperiod-mapping = minty.metadata.period:main",
             "minty-slim = minty.tools.tree.slimmer:main",
+            "minty-event-catalogue = minty.tools.event_catalogue:main",
         ]
     },
 )
@@ -0,0 +1,73 @@
+"""
+Delta R matrices and overlap removal (minty.utils.delta_r)
+"""
+
+from math import pi
+from random import Random
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+pytest.importorskip("ROOT")
+
+from minty.utils.delta_r import delta_r, delta_r_matrix, overlap_removal
+
+class Point(object):
+    def __init__(self, eta, phi):
+        self.eta, self.phi = eta, phi
+
+    def __repr__(self):
+        return "Point(%r, %r)" % (self.eta, self.phi)
+
+def arrays(points):
+    return (numpy.array([p.eta for p in points]),
+            numpy.array([p.phi for p in points]))
+
+def test_phi_wraps_around():
+    a, b = Point(0.5, pi - 0.05), Point(0.5, -pi + 0.05)
+    matrix = delta_r_matrix(*(arrays([a]) + arrays([b])))
+    assert matrix.shape == (1, 1)
+    assert abs(matrix[0, 0] - 0.1) < 1e-9
+    assert abs(delta_r_matrix(*(arrays([b]) + arrays([a])))[0, 0] - 0.1) < 1e-9
+
+def test_matches_delta_r():
+    random = Random(1)
+    points = [Point(random.uniform(-2.5, 2.5), random.uniform(-pi, pi))
+              for i in range(20)]
+    matrix = delta_r_matrix(*(arrays(points[:8]) + arrays(points[8:])))
+    for i, p in enumerate(points[:8]):
+        for j, q in enumerate(points[8:]):
+            assert abs(matrix[i, j] - delta_r(p, q)) < 1e-9
+
+def test_overlap_across_the_phi_boundary():
+    electron = Point(0.2, pi - 0.02)
+    near, far = Point(0.2, -pi + 0.02), Point(0.2, 0.)
+    kept, matrix = overlap_removal([near, far], [electron], 0.1)
+    assert kept == [far]
+    assert matrix.shape == (2, 1)
+
+def test_self_pairs_are_skipped():
+    isolated = Point(0., 0.)
+    close1, close2 = Point(1., 1.), Point(1.05, 1.)
+    objects = [isolated, close1, close2]
+    # Compared with itself, an object would always be at Delta R = 0
+    kept, _ = overlap_removal(objects, objects, 0.1)
+    assert kept == [isolated]
+
+def test_shared_objects_across_collections():
+    # Differently named collections sharing an object: only other objects
+    # can remove it
+    shared, other = Point(0., 0.), Point(2., 2.)
+    kept, _ = overlap_removal([shared, other], [shared], 0.1)
+    assert kept == [shared, other]
+
+    # An equal but distinct object still counts
+    twin = Point(0., 0.)
+    kept, _ = overlap_removal([shared, other], [twin], 0.1)
+    assert kept == [other]
+
+def test_no_others():
+    objects = [Point(0., 0.)]
+    kept, matrix = overlap_removal(objects, [], 0.1)
+    assert kept == objects
+    assert matrix.shape == (1, 0)
@@ -0,0 +1,77 @@
+"""
+The order in which AnalysisBase.event switches the result store and the input
+file, when an entry starts both a new run and a new file.
+"""
+
+import pytest
+
+pytest.importorskip("ROOT")
+
+import minty.base
+from minty.base import AnalysisBase, GrowCollections
+
+class Options(object):
+    adaptive_capacity = False
+
+class Event(object):
+    RunNumber = 180164
+    LumiBlock = 1
+
+class RecordingAnalysis(AnalysisBase):
+    root_tree = "file-2"
+
+    def __init__(self, options):
+        # No input: only what event() needs
+        self.options = options
+        self.calls = []
+        self.tasks = []
+        self.current_tree, self.current_run = "file-1", None
+        self.previous_run = 167776
+        self.kept_entries = None
+        self.events_to_dump = []
+        self.events_looped = 0
+        self.heartbeat_countdown = 1000
+
+    def init_result_store(self, period, run):
+        self.calls.append(("init_result_store", run))
+
+    def new_tree(self):
+        self.calls.append(("new_tree", self.root_tree))
+
+    def check_capacities(self, entry):
+        self.calls.append(("check_capacities", entry))
+
+@pytest.fixture(autouse=True)
+def fixed_period(monkeypatch):
+    monkeypatch.setattr(minty.base, "period_from_run",
+                        lambda run: ("L", (run, run)))
+
+def test_new_run_and_file():
+    analysis = RecordingAnalysis(Options())
+    analysis.event(42, Event())
+    # The previous run's store is flushed before the new file is recorded
+    assert analysis.calls == [("init_result_store", 180164),
+                              ("new_tree", "file-2")]
+    assert analysis.current_tree == "file-2"
+    assert analysis.previous_run == 180164
+
+def test_capacity_check_comes_first():
+    options = Options()
+    options.adaptive_capacity = True
+    analysis = RecordingAnalysis(options)
+    analysis.event(42, Event())
+    assert analysis.calls == [("check_capacities", 42),
+                              ("init_result_store", 180164),
+                              ("new_tree", "file-2")]
+
+def test_growing_records_nothing():
+    options = Options()
+    options.adaptive_capacity = True
+    analysis = RecordingAnalysis(options)
+    def grow(entry):
+        raise GrowCollections(entry, {"photons": 32})
+    analysis.check_capacities = grow
+    with pytest.raises(GrowCollections):
+        analysis.event(42, Event())
+    assert analysis.calls == []
+    assert analysis.current_tree == "file-1"
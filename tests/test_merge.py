@@ -0,0 +1,74 @@
+"""
+Merging analysis outputs (minty.histograms.merge), as done for --jobs
+"""
+
+from cPickle import loads
+
+import pytest
+
+R = pytest.importorskip("ROOT")
+
+from minty.histograms import HistogramManager, merge_outputs
+from minty.histograms.merge import unique_files
+
+def write_output(filename, events, files, metadata, run_numbers, cache_stats):
+    hm = HistogramManager(filename)
+    hm.write_parameter("processed_trees", len(files))
+    hm.write_parameter("jobs_files", 1)
+    hm.write_parameter("wrapper_objects", 1200)
+    hm.write_parameter("walltime", 1.5)
+    hm.write_parameter("exception_count", events // 100)
+    hm.write_object("file_processed_list", files)
+    hm.write_object("file_metadata", metadata)
+    hm.write_object("run_numbers", run_numbers)
+    hm.write_object("event_cache_stats", cache_stats)
+    fill = hm.get("ph_pt", b=[(10, 0, 100)])
+    for i in xrange(events):
+        fill(50)
+    hm.finalize()
+
+def read_output(filename):
+    f = R.TFile.Open(filename)
+    parameters, pickled = {}, {}
+    for key in f.GetListOfKeys():
+        obj = key.ReadObj()
+        if obj.ClassName().startswith("TParameter"):
+            parameters[key.GetName()] = obj.GetVal()
+        elif isinstance(obj, R.TObjString):
+            pickled[key.GetName()] = loads(obj.GetString().Data())
+    entries = f.Get("ph_pt").GetEntries()
+    f.Close()
+    return parameters, pickled, entries
+
+def test_merge_rules(tmpdir):
+    first, second = str(tmpdir.join("a.root")), str(tmpdir.join("b.root"))
+    merged = str(tmpdir.join("merged.root"))
+    write_output(first, 100, ["f1.root", "f2.root"], ["lumi1", "lumi2"],
+                 set([180164]), {"photons": {"hits": 3, "misses": 1}})
+    # f2.root was split between the two workers
+    write_output(second, 250, ["f2.root", "f3.root"], ["lumi2", "lumi3"],
+                 set([180164, 180400]), {"photons": {"hits": 5, "misses": 2}})
+
+    merge_outputs(merged, [first, second])
+    parameters, pickled, entries = read_output(merged)
+
+    # Histograms are added, parameters summed
+    assert entries == 350
+    assert parameters["walltime"] == 3.
+    assert parameters["exception_count"] == 3
+    # These describe the file or the job, so they keep the first value
+    assert parameters["jobs_files"] == 1
+    assert parameters["wrapper_objects"] == 1200
+    # Sets are unioned, dicts merged key by key
+    assert pickled["run_numbers"] == set([180164, 180400])
+    assert pickled["event_cache_stats"] == {"photons": {"hits": 8, "misses": 3}}
+    # Lists are concatenated, but a file is only listed and counted once
+    assert pickled["file_processed_list"] == ["f1.root", "f2.root", "f3.root"]
+    assert pickled["file_metadata"] == ["lumi1", "lumi2", "lumi3"]
+    assert parameters["processed_trees"] == 3
+
+def test_unique_files():
+    assert unique_files(["a", "b", "a", "c"], [1, 2, 3, 4]) == (
+        ["a", "b", "c"], [1, 2, 4])
+    # Without metadata for each file it is left alone
+    assert unique_files(["a", "a"], []) == (["a"], [])
@@ -0,0 +1,65 @@
+"""
+PairView (minty.treedefs.base) against building every pair with
+itertools.combinations
+"""
+
+from itertools import combinations
+from math import cos, sin, sinh, cosh, sqrt
+from random import Random
+
+import pytest
+
+pytest.importorskip("ROOT")
+pytest.importorskip("pytuple")
+
+from minty.treedefs.base import PairView
+
+class Object(object):
+    def __init__(self, pt, eta, phi, m):
+        self.pt, self.eta, self.phi = pt, eta, phi
+        self.E = sqrt((pt * cosh(eta))**2 + m*m)
+
+def mass(o1, o2):
+    px = o1.pt * cos(o1.phi) + o2.pt * cos(o2.phi)
+    py = o1.pt * sin(o1.phi) + o2.pt * sin(o2.phi)
+    pz = o1.pt * sinh(o1.eta) + o2.pt * sinh(o2.eta)
+    E = o1.E + o2.E
+    return sqrt(max(0., E*E - px*px - py*py - pz*pz))
+
+def make_objects(seed, n):
+    random = Random(seed)
+    return [Object(random.uniform(5e3, 150e3), random.uniform(-2.4, 2.4),
+                   random.uniform(-3.14, 3.14), random.choice([0., 105.]))
+            for i in range(n)]
+
+def brute_force_pairs(objects):
+    ordered = sorted(objects, key=lambda o: o.pt, reverse=True)
+    return list(combinations(ordered, 2))
+
+@pytest.mark.parametrize("n", [0, 1, 2, 7])
+def test_order_and_top(n):
+    objects = make_objects(n, n)
+    expected = brute_force_pairs(objects)
+    view = PairView(objects)
+    assert len(view) == len(expected)
+    assert list(view) == expected
+    assert view.leading() == (expected[0] if expected else None)
+    for k in (0, 1, 3, 100):
+        assert view.top(k) == expected[:k]
+
+@pytest.mark.parametrize("window", [
+    (0., 1e9),          # everything
+    (80e3, 100e3),      # around the Z
+    (200e3, 400e3),     # heavy: most pairs are pruned
+    (1e7, 2e7),         # nothing passes
+])
+def test_mass_window(window):
+    lo, hi = window
+    for seed in range(5):
+        objects = make_objects(seed, 12)
+        expected = [(o1, o2) for o1, o2 in brute_force_pairs(objects)
+                    if lo <= mass(o1, o2) <= hi]
+        found = list(PairView(objects).in_mass_window(lo, hi))
+        assert [(o1, o2) for o1, o2, _ in found] == expected
+        for o1, o2, m in found:
+            assert abs(m - mass(o1, o2)) < 1e-6 * m + 1e-6
@@ -0,0 +1,37 @@
+"""
+Saving branch profiles (minty.treedefs.profile), from one or several workers
+"""
+
+import os
+
+import pytest
+
+pytest.importorskip("ROOT")
+
+from minty.treedefs.profile import load_profile, save_profile
+
+def test_save_adds_to_profile(tmpdir):
+    filename = str(tmpdir.join("A.eg.branches"))
+    save_profile(filename, ["ph_eta", "ph_pt"])
+    save_profile(filename, set(["ph_pt", "el_pt"]))
+    assert load_profile(filename) == set(["ph_eta", "ph_pt", "el_pt"])
+
+def test_workers_save_at_once(tmpdir):
+    filename = str(tmpdir.join("A.eg.branches"))
+    workers = []
+    for i in range(8):
+        pid = os.fork()
+        if not pid:
+            try:
+                for j in range(20):
+                    save_profile(filename, ["branch_%i_%i" % (i, j)])
+            finally:
+                os._exit(0)
+        workers.append(pid)
+    for pid in workers:
+        assert os.waitpid(pid, 0)[1] == 0
+
+    expected = set("branch_%i_%i" % (i, j) for i in range(8) for j in range(20))
+    assert load_profile(filename) == expected
+    assert not [name for name in os.listdir(str(tmpdir))
+                if name.endswith(".tmp")]
@@ -0,0 +1,106 @@
+"""
+The array API of the v16 energy correction (minty.treedefs.rescaling), for
+electrons and photons, with a stand-in rescaler
+"""
+
+from math import cosh
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+pytest.importorskip("ROOT")
+pytest.importorskip("pytuple")
+
+from minty.treedefs import rescaling
+from minty.treedefs.base import Global
+from minty.treedefs.columnar import JaggedArray
+
+class Rescaler(object):
+    "Scales the energy by a factor for each part type"
+    FACTORS = {"ELECTRON": 1.01, "UNCONVERTED_PHOTON": 1.02,
+               "CONVERTED_PHOTON": 1.03}
+
+    def applyEnergyCorrection(self, eta, phi, E, et, value, part_type):
+        assert abs(et - E / cosh(eta)) < 1e-6
+        return E * self.FACTORS[part_type] + value
+
+class Cluster(object):
+    def __init__(self, E, phi, pt):
+        self.E, self.phi, self.pt = E, phi, pt
+
+class Electron(object):
+    "Like treedefs.base.Electron, which has no isConv"
+    particle = "electron"
+    _part_type = "ELECTRON"
+    _v16_energy_rescaler = Rescaler()
+
+    def __init__(self, E, eta, phi):
+        self.cl = Cluster(E, phi, E / cosh(eta))
+        self.etas1 = self.etas2 = eta
+        self.phi = phi
+
+class Photon(Electron):
+    particle = "photon"
+
+    def __init__(self, E, eta, phi, isConv):
+        Electron.__init__(self, E, eta, phi)
+        self.isConv = isConv
+
+    @property
+    def _part_type(self):
+        return "CONVERTED_PHOTON" if self.isConv else "UNCONVERTED_PHOTON"
+
+class Event(object):
+    def __init__(self, electrons, photons):
+        self.electrons, self.photons = electrons, photons
+
+@pytest.fixture(autouse=True)
+def no_batch_helper(monkeypatch):
+    # EnergyRescaler.h isn't available to compile against here
+    monkeypatch.setattr(rescaling.batch_helper, "available", False)
+
+def make_global(event):
+    g = Global.__new__(Global)
+    g._event = event
+    return g
+
+def test_electrons():
+    electrons = [Electron(50e3, 0.3, 1.), Electron(20e3, -1.8, -2.)]
+    g = make_global(Event(electrons, []))
+    fourvecs = g.v16_corrections("electrons", n=0)
+    assert len(fourvecs) == 2
+    assert list(fourvecs.E) == [50e3 * 1.01, 20e3 * 1.01]
+    assert list(fourvecs.isConv) == [0, 0]
+    assert [v.isConv for v in fourvecs] == [0, 0]
+
+def test_photons():
+    photons = [Photon(40e3, 0.1, 0.5, 1), Photon(30e3, 1.1, 2.5, 0)]
+    g = make_global(Event([], photons))
+    fourvecs = g.v16_corrections("photons", n=1)
+    assert list(fourvecs.E) == [40e3 * 1.03 + 1, 30e3 * 1.02 + 1]
+    assert list(fourvecs.isConv) == [1, 0]
+
+def test_no_objects():
+    g = make_global(Event([], []))
+    assert len(g.v16_corrections("electrons")) == 0
+
+class Columns(object):
+    "Just enough of a columnar collection, without isConv"
+    def __init__(self, E, eta, phi, counts):
+        def jagged(values):
+            return JaggedArray.from_counts(numpy.array(values), counts)
+        self.etas2 = self.etas1 = jagged(eta)
+        self.phi = jagged(phi)
+        self.cl = Cluster(jagged(E), jagged(phi),
+                          jagged(numpy.array(E) / numpy.cosh(eta)))
+
+def test_chunk_electrons():
+    electrons = Columns([50e3, 20e3, 10e3], [0.3, -1.8, 2.], [1., -2., 0.],
+                        [2, 0, 1])
+    fourvecs = rescaling.chunk_v16_corrections(Rescaler(), electrons,
+                                               "electron")
+    assert list(fourvecs.E.counts) == [2, 0, 1]
+    assert numpy.allclose(fourvecs.E.content,
+                          [50e3 * 1.01, 20e3 * 1.01, 10e3 * 1.01])
+    assert list(fourvecs.isConv.content) == [0, 0, 0]
+    assert list(fourvecs.isConv.offsets) == list(fourvecs.E.offsets)
@@ -26,7 +26,7 @@ def make_chain(treename, files):
     return t
 
 def main():
-    minty.init_root()
+    minty.init_root(quiet=True)
 
     from time import time
     